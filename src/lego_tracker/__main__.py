@@ -1,4 +1,4 @@
-from .gui.main_menu import main
+from .cli import main
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,283 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .set_files import (
+    apply_have_changes,
+    have_change_events,
+    load_set_data,
+    save_set_data,
+)
+from .state_bus import state_bus
+
+PartKey = Tuple[str, str]
+
+
+# This makes (ID, color) lookups ignore capitalization.
+def part_key(part_id: str, color: str) -> PartKey:
+    return (part_id.strip().lower(), color.strip().lower())
+
+
+# A pasted line as (line number, part ID, color or None, count, whether
+# the count had a leading sign)
+PartLine = Tuple[int, str, Optional[str], int, bool]
+PartLabels = Dict[PartKey, Tuple[str, str]]
+
+
+# This splits "ID, color, count" lines on commas, semicolons or tabs.
+# A line may leave off the color, giving "ID, count", or the count,
+# giving "ID, color" for a single part.
+def parse_part_lines(text: str) -> Tuple[List[PartLine], List[str]]:
+    lines: List[PartLine] = []
+    errors: List[str] = []
+    for line_num, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        fields = [field.strip() for field in re.split(r'[,;\t]', line)]
+
+        if len(fields) == 2 and re.fullmatch(r'[+-]?\d+', fields[1]):
+            fields.insert(1, '')
+        elif len(fields) == 2:
+            fields.append('1')
+        if len(fields) != 3 or not fields[0]:
+            errors.append(f"Line {line_num}: expected ID, color, count.")
+            continue
+
+        part_id, color, count = fields
+        try:
+            amount = int(count)
+        except ValueError:
+            errors.append(f"Line {line_num}: '{count}' is not a number.")
+            continue
+        lines.append((
+            line_num, part_id, color or None, amount,
+            count.startswith(('+', '-'))
+        ))
+    return lines, errors
+
+
+# This turns "ID, color, count" lines into a dictionary of found parts,
+# along with the ID and color of each as the user wrote them.
+def parse_found_parts(
+    text: str
+) -> Tuple[Dict[PartKey, int], PartLabels, List[str]]:
+
+    lines, errors = parse_part_lines(text)
+    found: Dict[PartKey, int] = {}
+    labels: PartLabels = {}
+    for line_num, part_id, color, count, _ in lines:
+        if color is None:
+            errors.append(f"Line {line_num}: {part_id} needs a color.")
+            continue
+        if count > 0:
+            key = part_key(part_id, color)
+            found[key] = found.get(key, 0) + count
+            labels.setdefault(key, (part_id, color))
+    return found, labels, errors
+
+
+# This keeps the remaining need of every set, reloading only changed files.
+class NeedIndex:
+    def __init__(self, set_data_dir: str = 'set_data') -> None:
+        self.set_data_dir = set_data_dir
+        self.mtimes: Dict[str, Tuple[int, int]] = {}
+
+        # Remaining need per set, and the sets needing each part
+        self.set_needs: Dict[str, Dict[PartKey, int]] = {}
+        self.part_sets: Dict[PartKey, Dict[str, int]] = {}
+
+        # Display ID and color for each lowercase key
+        self.labels: PartLabels = {}
+
+        # The server refreshes and reads the index from many threads
+        self.lock = threading.RLock()
+
+    def _drop_set(self, set_name: str) -> None:
+        for key in self.set_needs.pop(set_name, {}):
+            sets = self.part_sets.get(key, {})
+            sets.pop(set_name, None)
+            if not sets:
+                self.part_sets.pop(key, None)
+
+    # Replace a set's remaining need with the given parts list
+    def update_set(
+        self,
+        set_name: str,
+        parts_data: List[Dict[str, Any]]
+    ) -> None:
+
+        self._drop_set(set_name)
+        needs: Dict[PartKey, int] = {}
+        for part in parts_data:
+            remaining = part["need"] - part["have"]
+            if remaining <= 0:
+                continue
+            key = part_key(part["id"], part["color"])
+            self.labels.setdefault(key, (part["id"], part["color"]))
+            needs[key] = needs.get(key, 0) + remaining
+
+        if needs:
+            self.set_needs[set_name] = needs
+            for key, remaining in needs.items():
+                self.part_sets.setdefault(key, {})[set_name] = remaining
+
+    # Reload any set files that were added, changed or removed
+    def refresh(self) -> None:
+        seen = set()
+        for set_file in os.listdir(self.set_data_dir):
+            if not set_file.endswith('.txt'):
+                continue
+            set_name = set_file[:-4]
+            seen.add(set_name)
+
+            file_path = os.path.join(self.set_data_dir, set_file)
+            stat = os.stat(file_path)
+            mtime = (stat.st_mtime_ns, stat.st_size)
+            if self.mtimes.get(set_name) == mtime:
+                continue
+
+            try:
+                with open(file_path, 'r') as f:
+                    data = json.load(f)
+                if data.get("set_info", {}).get("completed", False):
+                    self.update_set(set_name, [])
+                else:
+                    self.update_set(set_name, data["parts"])
+                self.mtimes[set_name] = mtime
+            except (json.JSONDecodeError, KeyError, FileNotFoundError):
+                self._drop_set(set_name)
+                self.mtimes.pop(set_name, None)
+
+        for set_name in set(self.mtimes) - seen:
+            self._drop_set(set_name)
+            del self.mtimes[set_name]
+
+
+# One index per data directory is shared by every caller
+_indexes: Dict[str, NeedIndex] = {}
+
+def get_need_index(set_data_dir: str = 'set_data') -> NeedIndex:
+    key = os.path.abspath(set_data_dir)
+    if key not in _indexes:
+        _indexes[key] = NeedIndex(set_data_dir)
+    with _indexes[key].lock:
+        _indexes[key].refresh()
+    return _indexes[key]
+
+
+# This assigns found parts to sets so that the most sets get completed.
+# Parts no set needs keep the ID and color they were given with.
+def allocate_parts(
+    found: Dict[PartKey, int],
+    index: NeedIndex,
+    labels: Optional[PartLabels] = None
+) -> Dict[str, Any]:
+
+    # The index must not change while parts are being assigned
+    with index.lock:
+        pool = {key: qty for key, qty in found.items() if qty > 0}
+        assignments: Dict[str, Dict[PartKey, int]] = {}
+        completed: List[str] = []
+
+        def assign(set_name: str, key: PartKey, qty: int) -> None:
+            pool[key] -= qty
+            set_parts = assignments.setdefault(set_name, {})
+            set_parts[key] = set_parts.get(key, 0) + qty
+
+        # Only sets that need one of the found parts are worth checking
+        candidates = set()
+        for key in pool:
+            candidates.update(index.part_sets.get(key, {}))
+
+        # Complete the smallest remaining sets first while the parts last
+        for set_name in sorted(
+            candidates, key=lambda s: (sum(index.set_needs[s].values()), s)
+        ):
+            needs = index.set_needs[set_name]
+            if all(pool.get(key, 0) >= qty for key, qty in needs.items()):
+                for key, qty in needs.items():
+                    assign(set_name, key, qty)
+                completed.append(set_name)
+
+        # Give leftover parts to the sets closest to completion
+        def remaining_after(set_name: str) -> int:
+            given = assignments.get(set_name, {})
+            return sum(
+                qty - given.get(key, 0)
+                for key, qty in index.set_needs[set_name].items()
+            )
+
+        for key in sorted(pool):
+            sets = [
+                s for s in index.part_sets.get(key, {}) if s not in completed
+            ]
+            sets.sort(key=lambda s: (remaining_after(s), s))
+            for set_name in sets:
+                if pool[key] <= 0:
+                    break
+                given = assignments.get(set_name, {}).get(key, 0)
+                qty = min(pool[key], index.part_sets[key][set_name] - given)
+                if qty > 0:
+                    assign(set_name, key, qty)
+
+        return {
+            "assignments": assignments,
+            "completed": completed,
+            "leftover": {key: qty for key, qty in pool.items() if qty > 0},
+            "labels": {
+                key: index.labels.get(key) or (labels or {}).get(key, key)
+                for key in pool
+            }
+        }
+
+
+# This formats an allocation as readable text.
+def describe_allocation(allocation: Dict[str, Any]) -> str:
+    def label(key: PartKey) -> str:
+        part_id, color = allocation["labels"].get(key, key)
+        return f"{part_id} ({color})"
+
+    lines: List[str] = []
+    for set_name, parts in sorted(allocation["assignments"].items()):
+        if set_name in allocation["completed"]:
+            lines.append(f"{set_name} - COMPLETES SET")
+        else:
+            lines.append(set_name)
+        for key, qty in sorted(parts.items()):
+            lines.append(f"    {qty}x {label(key)}")
+
+    if allocation["leftover"]:
+        lines.append("Not needed by any set:")
+        for key, qty in sorted(allocation["leftover"].items()):
+            lines.append(f"    {qty}x {label(key)}")
+
+    return "\n".join(lines) if lines else "No parts to allocate."
+
+
+# This records allocated parts in each set's file.
+def apply_allocation(
+    allocation: Dict[str, Any],
+    set_data_dir: str = 'set_data'
+) -> None:
+
+    for set_name, parts in allocation["assignments"].items():
+        parts_data, _ = load_set_data(set_name, set_data_dir)
+        remaining = dict(parts)
+        changes: Dict[int, int] = {}
+        for i, part in enumerate(parts_data):
+            key = part_key(part["id"], part["color"])
+            if remaining.get(key, 0) <= 0:
+                continue
+            qty = min(remaining[key], part["need"] - part["have"])
+            if qty > 0:
+                changes[i] = part["have"] + qty
+                remaining[key] -= qty
+
+        previous = apply_have_changes(parts_data, changes)
+        save_set_data(set_name, parts_data, set_data_dir)
+        state_bus.publish(
+            "have_changed", set_title=set_name, set_data_dir=set_data_dir,
+            parts=have_change_events(parts_data, previous), source=None
+        )
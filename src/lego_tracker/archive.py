@@ -0,0 +1,165 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from .set_files import (
+    bump_collection_version,
+    iter_set_file,
+    list_set_titles,
+    replacement_mode,
+    write_json_atomic,
+)
+from .state_bus import state_bus
+
+# Completed sets are moved out of the data directory into this one, so
+# searching and listing only ever read the sets still being worked on
+ARCHIVE_DIR_NAME = '.archive'
+MANIFEST_NAME = 'manifest.json'
+
+
+def archive_dir(set_data_dir: str = 'set_data') -> str:
+    return os.path.join(set_data_dir, ARCHIVE_DIR_NAME)
+
+
+def archive_path(set_title: str, set_data_dir: str = 'set_data') -> str:
+    return os.path.join(archive_dir(set_data_dir), f"{set_title}.json.gz")
+
+
+# This loads the manifest describing every archived set by title.
+def load_manifest(set_data_dir: str = 'set_data') -> Dict[str, Any]:
+    manifest_path = os.path.join(archive_dir(set_data_dir), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+
+def save_manifest(
+    manifest: Dict[str, Any],
+    set_data_dir: str = 'set_data'
+) -> None:
+
+    write_json_atomic(
+        os.path.join(archive_dir(set_data_dir), MANIFEST_NAME), manifest
+    )
+
+
+# This lists the titles of every archived set without opening any of them.
+def list_archived_sets(set_data_dir: str = 'set_data') -> List[str]:
+    return sorted(load_manifest(set_data_dir))
+
+
+# This compresses a set's data through a temporary file, as
+# write_json_atomic does for plain files.
+def write_archive_atomic(file_path: str, data: Any) -> None:
+    directory = os.path.dirname(file_path)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(file_path)}.", suffix='.tmp', dir=directory
+    )
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(
+                filename='', mode='wb', fileobj=raw, mtime=0
+            ) as f:
+                f.write(json.dumps(data).encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.chmod(tmp_path, replacement_mode(file_path))
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# This checks whether a set file is marked completed and was not just
+# restored, reading no further than its set_info.
+def should_archive(set_title: str, set_data_dir: str = 'set_data') -> bool:
+    stream = iter_set_file(os.path.join(set_data_dir, f"{set_title}.txt"))
+    try:
+        for key, value in stream:
+            if key == "set_info":
+                return bool(
+                    value.get("completed", False) and
+                    not value.get("restored", False)
+                )
+    except (OSError, ValueError):
+        pass
+    finally:
+        stream.close()
+    return False
+
+
+# This moves one set into the archive.
+def archive_set(set_title: str, set_data_dir: str = 'set_data') -> None:
+    file_path = os.path.join(set_data_dir, f"{set_title}.txt")
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+
+    os.makedirs(archive_dir(set_data_dir), exist_ok=True)
+    write_archive_atomic(archive_path(set_title, set_data_dir), data)
+
+    set_info = data.get("set_info", {})
+    manifest = load_manifest(set_data_dir)
+    manifest[set_title] = {
+        "set_id": set_info.get("set_id"),
+        "name": set_info.get("name"),
+        "year": set_info.get("year"),
+        "num_parts": set_info.get("num_parts"),
+        "parts_found": set_info.get("parts_found"),
+        "archived": time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    save_manifest(manifest, set_data_dir)
+
+    # Only drop the set file once the archive holds it safely
+    os.remove(file_path)
+    bump_collection_version()
+    state_bus.publish("sets_changed", set_data_dir=set_data_dir)
+
+
+# This decompresses an archived set's data without restoring it.
+def read_archived_set(
+    set_title: str,
+    set_data_dir: str = 'set_data'
+) -> Dict[str, Any]:
+
+    if set_title not in load_manifest(set_data_dir):
+        raise KeyError(set_title)
+    with gzip.open(archive_path(set_title, set_data_dir), 'rt') as f:
+        return json.load(f)
+
+
+# This moves an archived set back into the data directory, e.g. when one
+# of its parts has gone missing. It is marked restored, which keeps it
+# out of the archive until it is next saved.
+def restore_set(set_title: str, set_data_dir: str = 'set_data') -> None:
+    file_path = os.path.join(set_data_dir, f"{set_title}.txt")
+    if os.path.exists(file_path):
+        raise Exception("Set already exists.")
+
+    data = read_archived_set(set_title, set_data_dir)
+    data.setdefault("set_info", {})["restored"] = True
+    write_json_atomic(file_path, data)
+
+    manifest = load_manifest(set_data_dir)
+    manifest.pop(set_title, None)
+    save_manifest(manifest, set_data_dir)
+    os.remove(archive_path(set_title, set_data_dir))
+    state_bus.publish("sets_changed", set_data_dir=set_data_dir)
+
+
+# This archives every completed set, returning their titles.
+def archive_completed_sets(set_data_dir: str = 'set_data') -> List[str]:
+    completed = [
+        set_title for set_title in list_set_titles(set_data_dir)
+        if should_archive(set_title, set_data_dir)
+    ]
+    for set_title in completed:
+        archive_set(set_title, set_data_dir)
+    return completed
@@ -0,0 +1,335 @@
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+from .allocation import (
+    allocate_parts,
+    apply_allocation,
+    describe_allocation,
+    get_need_index,
+    parse_found_parts,
+)
+from .maintenance import check_collection, describe_check, rebuild_thumbnails
+
+
+# This suggests which sets the given found parts should go into.
+def run_allocate(args: argparse.Namespace) -> int:
+    lines = list(args.parts)
+    if args.file == '-':
+        lines.extend(sys.stdin.read().splitlines())
+    elif args.file:
+        with open(args.file, 'r') as f:
+            lines.extend(f.read().splitlines())
+
+    found, labels, errors = parse_found_parts("\n".join(lines))
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        return 1
+
+    index = get_need_index(args.set_data_dir)
+    allocation = allocate_parts(found, index, labels)
+    print(describe_allocation(allocation))
+
+    if args.apply:
+        apply_allocation(allocation, args.set_data_dir)
+        print("Allocation saved.")
+    return 0
+
+
+# This validates and repairs every set file in the collection.
+def run_check(args: argparse.Namespace) -> int:
+    start = time.perf_counter()
+    results = check_collection(args.set_data_dir, args.fix, args.jobs)
+    print(describe_check(results, time.perf_counter() - start))
+
+    if args.thumbnails:
+        count = rebuild_thumbnails(args.set_data_dir)
+        print(f"Thumbnail atlases hold {count} images.")
+
+    # Corrupt files, or stale ones left unfixed, make the check fail
+    failed = any(
+        result["errors"] or (result["repairs"] and not result["fixed"])
+        for result in results
+    )
+    return 1 if failed else 0
+
+
+# This updates tracked sets to match their current Rebrickable inventories.
+def run_resync(args: argparse.Namespace) -> int:
+    from .gui.create_win import describe_resync, resync_all_sets, resync_set
+
+    if args.sets:
+        results = {}
+        for set_title in args.sets:
+            try:
+                results[set_title] = resync_set(
+                    set_title, args.set_data_dir, args.dry_run
+                )
+            except Exception as e:
+                results[set_title] = {"error": [str(e)]}
+    else:
+        results = resync_all_sets(args.set_data_dir, args.dry_run)
+
+    for set_title, changes in results.items():
+        print(describe_resync(set_title, changes))
+    return 1 if any("error" in changes for changes in results.values()) else 0
+
+
+# This exports the remaining need as CSV or a BrickLink wanted list.
+def run_export(args: argparse.Namespace) -> int:
+    from .transfer import export_bricklink_xml, export_csv
+
+    if args.equivalent and not args.aggregate:
+        print("--equivalent needs --aggregate.", file=sys.stderr)
+        return 1
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'xml':
+            count, unmapped = export_bricklink_xml(
+                out, args.set_data_dir, args.set, args.aggregate,
+                args.equivalent
+            )
+            if unmapped:
+                print(
+                    f"No BrickLink color for: {', '.join(unmapped)}",
+                    file=sys.stderr
+                )
+        else:
+            count = export_csv(
+                out, args.set_data_dir, args.set, args.aggregate,
+                args.equivalent
+            )
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {count} rows.", file=sys.stderr)
+    return 0
+
+
+# This imports "have" counts from CSV or a BrickLink wanted list.
+def run_import(args: argparse.Namespace) -> int:
+    from .transfer import (
+        import_updates,
+        read_bricklink_updates,
+        read_csv_updates,
+    )
+
+    file_format = args.format or (
+        'xml' if args.file.lower().endswith('.xml') else 'csv'
+    )
+    with open(args.file, 'r', newline='') as source:
+        if file_format == 'xml':
+            updates = read_bricklink_updates(source, args.set_data_dir)
+        else:
+            updates = read_csv_updates(source)
+        try:
+            summary = import_updates(updates, args.set_data_dir, args.dry_run)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    for set_title, rows in sorted(summary['skipped'].items()):
+        print(
+            f"Skipped {rows} rows for {set_title}, which is not in the "
+            "collection.", file=sys.stderr
+        )
+    action = "Would update" if args.dry_run else "Updated"
+    print(f"{action} {summary['parts']} parts in {summary['sets']} sets.")
+    return 0
+
+
+# This serves the collection to other devices until interrupted.
+def run_serve(args: argparse.Namespace) -> int:
+    from .server import serve
+
+    serve(args.host, args.port, args.set_data_dir)
+    return 0
+
+
+# This archives completed sets, or lists or restores archived ones.
+def run_archive(args: argparse.Namespace) -> int:
+    from .archive import (
+        archive_completed_sets,
+        list_archived_sets,
+        restore_set,
+    )
+
+    if args.list:
+        for set_title in list_archived_sets(args.set_data_dir):
+            print(set_title)
+        return 0
+
+    if args.restore:
+        archived = list_archived_sets(args.set_data_dir)
+        for set_title in args.restore:
+            if set_title not in archived:
+                print(f"{set_title} is not archived.", file=sys.stderr)
+                return 1
+        for set_title in args.restore:
+            restore_set(set_title, args.set_data_dir)
+            print(f"Restored {set_title}.")
+        return 0
+
+    for set_title in archive_completed_sets(args.set_data_dir):
+        print(f"Archived {set_title}.")
+    return 0
+
+
+# This downloads part relationships and stores the equivalence classes.
+def run_equivalents(args: argparse.Namespace) -> int:
+    from .equivalence import load_part_classes
+
+    part_classes = load_part_classes(args.set_data_dir, refresh=True)
+    print(
+        f"Stored {len(set(part_classes.values()))} classes covering "
+        f"{len(part_classes)} parts."
+    )
+    return 0
+
+
+# This builds the command line parser for every subcommand.
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='lego-tracker',
+        description="Track inventories of required parts for LEGO sets. "
+                    "Runs the GUI when no command is given."
+    )
+    parser.add_argument(
+        '--set-data-dir', default='set_data',
+        help="directory holding the set files (default: set_data)"
+    )
+    subparsers = parser.add_subparsers(dest='command')
+
+    allocate_parser = subparsers.add_parser(
+        'allocate', help="suggest which sets found parts should go into"
+    )
+    allocate_parser.add_argument(
+        'parts', nargs='*', metavar='"ID,COLOR[,COUNT]"',
+        help="found parts, e.g. \"3001,Red,2\""
+    )
+    allocate_parser.add_argument(
+        '-f', '--file',
+        help="read one found part per line from a file ('-' for stdin)"
+    )
+    allocate_parser.add_argument(
+        '--apply', action='store_true',
+        help="record the allocated parts in each set's file"
+    )
+    allocate_parser.set_defaults(func=run_allocate)
+
+    check_parser = subparsers.add_parser(
+        'check', help="validate set files and recompute derived fields"
+    )
+    check_parser.add_argument(
+        '--fix', action='store_true',
+        help="rewrite files whose derived fields are out of date"
+    )
+    check_parser.add_argument(
+        '-j', '--jobs', type=int,
+        help="number of worker processes (default: one per core)"
+    )
+    check_parser.add_argument(
+        '--thumbnails', action='store_true',
+        help="also download any thumbnails missing from the atlases and "
+             "hash them for Find by Photo"
+    )
+    check_parser.set_defaults(func=run_check)
+
+    resync_parser = subparsers.add_parser(
+        'resync', help="update sets to their current Rebrickable inventory"
+    )
+    resync_parser.add_argument(
+        'sets', nargs='*', metavar='SET',
+        help="set titles to re-sync (default: every set)"
+    )
+    resync_parser.add_argument(
+        '--dry-run', action='store_true',
+        help="show the changes without saving them"
+    )
+    resync_parser.set_defaults(func=run_resync)
+
+    export_parser = subparsers.add_parser(
+        'export', help="export the remaining need of the collection"
+    )
+    export_parser.add_argument(
+        '--format', choices=['csv', 'xml'], default='csv',
+        help="CSV or BrickLink wanted list XML (default: csv)"
+    )
+    export_parser.add_argument(
+        '--set', action='append', metavar='SET',
+        help="only export this set (may be repeated)"
+    )
+    export_parser.add_argument(
+        '--aggregate', action='store_true',
+        help="total each part and color across sets"
+    )
+    export_parser.add_argument(
+        '--equivalent', action='store_true',
+        help="with --aggregate, total alternate, mold and print variants "
+             "as one part"
+    )
+    export_parser.add_argument(
+        '-o', '--output', help="file to write (default: stdout)"
+    )
+    export_parser.set_defaults(func=run_export)
+
+    import_parser = subparsers.add_parser(
+        'import', help="import have counts from CSV or a BrickLink list"
+    )
+    import_parser.add_argument('file', help="CSV or XML file to import")
+    import_parser.add_argument(
+        '--format', choices=['csv', 'xml'],
+        help="file format (default: from the file extension)"
+    )
+    import_parser.add_argument(
+        '--dry-run', action='store_true',
+        help="report the changes without saving them"
+    )
+    import_parser.set_defaults(func=run_import)
+
+    archive_parser = subparsers.add_parser(
+        'archive', help="move completed sets into the compressed archive"
+    )
+    archive_parser.add_argument(
+        '--list', action='store_true', help="list the archived sets"
+    )
+    archive_parser.add_argument(
+        '--restore', nargs='+', metavar='SET',
+        help="move archived sets back into the collection"
+    )
+    archive_parser.set_defaults(func=run_archive)
+
+    equivalents_parser = subparsers.add_parser(
+        'equivalents',
+        help="download alternate, mold and print relationships"
+    )
+    equivalents_parser.set_defaults(func=run_equivalents)
+
+    serve_parser = subparsers.add_parser(
+        'serve', help="let several sorters update counts over HTTP"
+    )
+    serve_parser.add_argument(
+        '--host', default='127.0.0.1',
+        help="address to listen on; 0.0.0.0 allows the whole LAN "
+             "(default: 127.0.0.1)"
+    )
+    serve_parser.add_argument(
+        '--port', type=int, default=8765,
+        help="port to listen on (default: 8765)"
+    )
+    serve_parser.set_defaults(func=run_serve)
+
+    return parser
+
+
+# This runs a subcommand, or the GUI when none is given.
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        from .gui.main_menu import main as run_gui
+        run_gui()
+        return
+    sys.exit(args.func(args))
@@ -0,0 +1,195 @@
+import heapq
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .set_files import write_json_atomic
+
+COLORS_URL = "https://rebrickable.com/api/v3/lego/colors/?page_size=1000"
+COLOR_TABLE_NAME = '.colors.json'
+
+
+# This downloads Rebrickable's color list, keyed by color name.
+def fetch_color_table() -> Dict[str, Dict[str, Any]]:
+    import requests
+    from .settings import REBRICKABLE_API_KEY
+
+    headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
+    response = requests.get(COLORS_URL, headers=headers)
+    if response.status_code != 200:
+        raise Exception("Failed to fetch colors from Rebrickable API")
+
+    colors: Dict[str, Dict[str, Any]] = {}
+    for color in response.json()["results"]:
+        bricklink_ids = (
+            color.get("external_ids", {}).get("BrickLink", {}).get("ext_ids")
+        )
+        colors[color["name"]] = {
+            "id": color["id"],
+            "rgb": color.get("rgb"),
+            "is_trans": color.get("is_trans", False),
+            "bricklink": bricklink_ids[0] if bricklink_ids else None
+        }
+    return colors
+
+
+# This loads the locally stored color table, downloading it if needed.
+def load_color_table(
+    set_data_dir: str = 'set_data',
+    refresh: bool = False
+) -> Dict[str, Dict[str, Any]]:
+
+    table_path = os.path.join(set_data_dir, COLOR_TABLE_NAME)
+    if not refresh and os.path.exists(table_path):
+        try:
+            with open(table_path, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            pass
+
+    colors = fetch_color_table()
+    write_json_atomic(table_path, colors)
+    return colors
+
+
+# This finds the Rebrickable color name for a BrickLink color ID.
+def color_name_for_bricklink(
+    colors: Dict[str, Dict[str, Any]],
+    bricklink_id: int
+) -> Optional[str]:
+
+    for name, color in colors.items():
+        if color.get("bricklink") == bricklink_id:
+            return name
+    return None
+
+
+Lab = Tuple[float, float, float]
+
+
+# This converts a hex RGB string such as "A0A5A9" to CIE Lab, where the
+# straight-line distance between colors roughly matches how different
+# they look.
+def hex_to_lab(rgb: str) -> Lab:
+    rgb = rgb.strip().lstrip('#')
+    linear = []
+    for i in (0, 2, 4):
+        c = int(rgb[i:i + 2], 16) / 255
+        if c <= 0.04045:
+            linear.append(c / 12.92)
+        else:
+            linear.append(((c + 0.055) / 1.055) ** 2.4)
+    r, g, b = linear
+
+    # Linear sRGB to XYZ, relative to the D65 white point
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047
+    y = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883
+
+    def f(t: float) -> float:
+        return t ** (1 / 3) if t > 0.008856 else 7.787 * t + 16 / 116
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return (116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz))
+
+
+# This reads a color given as "#RRGGBB", "R, G, B" or a color name.
+def parse_color(text: str, colors: Dict[str, Dict[str, Any]]) -> Lab:
+    text = text.strip()
+    hex_text = text.lstrip('#')
+    if re.fullmatch(r'[0-9a-fA-F]{6}', hex_text):
+        return hex_to_lab(hex_text)
+
+    channels = [c.strip() for c in text.split(',')]
+    if len(channels) == 3 and all(c.isdigit() for c in channels):
+        values = [int(c) for c in channels]
+        if all(0 <= value <= 255 for value in values):
+            return hex_to_lab(''.join(f"{value:02x}" for value in values))
+
+    for name, color in colors.items():
+        if name.lower() == text.lower() and color.get("rgb"):
+            return hex_to_lab(color["rgb"])
+    raise ValueError(
+        f"'{text}' is not a color name, #RRGGBB value or R, G, B value."
+    )
+
+
+# This finds the colors closest to a given one with a k-d tree over the
+# Lab values of every color in the table.
+class ColorIndex:
+    def __init__(self, colors: Dict[str, Dict[str, Any]]) -> None:
+        points = [
+            (hex_to_lab(color["rgb"]), name)
+            for name, color in colors.items()
+            # Placeholder colors such as "[Unknown]" have no real value
+            if color.get("rgb") and not name.startswith('[')
+        ]
+        self.root = self._build(points, 0)
+
+    # Each node is (point, name, axis, left, right)
+    def _build(self, points: List[Tuple[Lab, str]], depth: int) -> Any:
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        mid = len(points) // 2
+        return (
+            points[mid][0], points[mid][1], axis,
+            self._build(points[:mid], depth + 1),
+            self._build(points[mid + 1:], depth + 1)
+        )
+
+    # The `count` nearest color names with their distances, closest first
+    def nearest(self, target: Lab, count: int) -> List[Tuple[str, float]]:
+        # Max-heap of the best matches so far, as (-distance², name)
+        best: List[Tuple[float, str]] = []
+
+        def visit(node: Any) -> None:
+            if node is None:
+                return
+            point, name, axis, left, right = node
+            dist_sq = sum((p - t) ** 2 for p, t in zip(point, target))
+            if len(best) < count:
+                heapq.heappush(best, (-dist_sq, name))
+            elif dist_sq < -best[0][0]:
+                heapq.heapreplace(best, (-dist_sq, name))
+
+            # Search the side holding the target first, then the other
+            # side only if it could hold something closer
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(best) < count or diff ** 2 < -best[0][0]:
+                visit(far)
+
+        if count > 0:
+            visit(self.root)
+        return [
+            (name, math.sqrt(-neg_dist_sq))
+            for neg_dist_sq, name in sorted(best, reverse=True)
+        ]
+
+
+# One index per data directory, rebuilt when the color table changes
+_color_indexes: Dict[
+    str, Tuple[int, Dict[str, Dict[str, Any]], ColorIndex]
+] = {}
+
+def get_color_index(
+    set_data_dir: str = 'set_data'
+) -> Tuple[Dict[str, Dict[str, Any]], ColorIndex]:
+
+    key = os.path.abspath(set_data_dir)
+    table_path = os.path.join(set_data_dir, COLOR_TABLE_NAME)
+    cached = _color_indexes.get(key)
+    if (
+        cached is None or not os.path.exists(table_path) or
+        os.stat(table_path).st_mtime_ns != cached[0]
+    ):
+        colors = load_color_table(set_data_dir)
+        _color_indexes[key] = (
+            os.stat(table_path).st_mtime_ns, colors, ColorIndex(colors)
+        )
+    return _color_indexes[key][1], _color_indexes[key][2]
@@ -0,0 +1,121 @@
+import csv
+import gzip
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .set_files import write_json_atomic
+
+RELATIONSHIPS_URL = (
+    "https://cdn.rebrickable.com/media/downloads/part_relationships.csv.gz"
+)
+PART_CLASSES_NAME = '.part_classes.json'
+
+# Rebrickable relationship types treated as the same part: alternates,
+# molds, prints and patterns. Pairs and sub-parts are different parts.
+EQUIVALENT_TYPES = {"A", "M", "P", "T"}
+
+
+# This groups items into disjoint classes, merging two classes at a time.
+class UnionFind:
+    def __init__(self) -> None:
+        self.parents: Dict[str, str] = {}
+
+    def find(self, item: str) -> str:
+        self.parents.setdefault(item, item)
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+
+        # Point everything on the path straight at the root
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, a: str, b: str) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parents[root_b] = root_a
+
+
+# This downloads Rebrickable's part relationships as
+# (type, child part, parent part) rows.
+def fetch_part_relationships() -> Iterator[Tuple[str, str, str]]:
+    import requests
+
+    response = requests.get(RELATIONSHIPS_URL)
+    if response.status_code != 200:
+        raise Exception("Failed to download part relationships")
+
+    with gzip.open(io.BytesIO(response.content), 'rt') as f:
+        for row in csv.DictReader(f):
+            yield (
+                row["rel_type"], row["child_part_num"], row["parent_part_num"]
+            )
+
+
+# This maps every part that has an equivalent to one representative part
+# number shared by its whole class.
+def build_part_classes(
+    relationships: Iterable[Tuple[str, str, str]]
+) -> Dict[str, str]:
+
+    classes = UnionFind()
+    for rel_type, child, parent in relationships:
+        if rel_type in EQUIVALENT_TYPES:
+            classes.union(child, parent)
+
+    # The shortest part number, usually the plain part, names the class
+    members: Dict[str, List[str]] = {}
+    for part in classes.parents:
+        members.setdefault(classes.find(part), []).append(part)
+    part_classes: Dict[str, str] = {}
+    for parts in members.values():
+        representative = min(parts, key=lambda part: (len(part), part))
+        for part in parts:
+            part_classes[part] = representative
+    return part_classes
+
+
+# This loads the locally stored part classes, downloading them if needed.
+def load_part_classes(
+    set_data_dir: str = 'set_data',
+    refresh: bool = False
+) -> Dict[str, str]:
+
+    classes_path = os.path.join(set_data_dir, PART_CLASSES_NAME)
+    if not refresh and os.path.exists(classes_path):
+        try:
+            with open(classes_path, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            pass
+
+    part_classes = build_part_classes(fetch_part_relationships())
+    write_json_atomic(classes_path, part_classes, None)
+    return part_classes
+
+
+# One set of classes per data directory, reloaded when the file changes
+_part_classes: Dict[str, Tuple[int, Dict[str, str]]] = {}
+
+def get_part_classes(set_data_dir: str = 'set_data') -> Dict[str, str]:
+    key = os.path.abspath(set_data_dir)
+    classes_path = os.path.join(set_data_dir, PART_CLASSES_NAME)
+    cached = _part_classes.get(key)
+    if (
+        cached is None or not os.path.exists(classes_path) or
+        os.stat(classes_path).st_mtime_ns != cached[0]
+    ):
+        part_classes = load_part_classes(set_data_dir)
+        _part_classes[key] = (
+            os.stat(classes_path).st_mtime_ns, part_classes
+        )
+    return _part_classes[key][1]
+
+
+# This names the class a part belongs to. Parts without any equivalent
+# are a class of their own.
+def part_class(part_classes: Dict[str, str], part_id: str) -> str:
+    return part_classes.get(part_id, part_id)
@@ -0,0 +1,117 @@
+import json
+import tkinter as tk
+from tkinter import messagebox
+from typing import Any, Dict, List
+
+from ..archive import list_archived_sets, read_archived_set, restore_set
+from ..state_bus import state_bus
+from .win_helpers import configure_size
+
+
+# This describes an archived set's parts as readable text.
+def describe_archived_set(
+        set_title: str, 
+        data: Dict[str, Any]
+) -> str:
+    
+    lines: List[str] = [set_title, ""]
+    for part in data.get("parts", []):
+        lines.append(
+            f"{part['have']}/{part['need']}  {part['id']}  "
+            f"{part['color']}  {part['name']}"
+        )
+    stickers = data.get("stickers", [])
+    if stickers:
+        lines.append("")
+        lines.append(f"Stickers: {len(stickers)}")
+    return "\n".join(lines)
+
+
+# This shows the archived sets, which can be viewed or restored.
+def show_archive_win(set_data_dir: str = 'set_data') -> None:
+    archive_window = tk.Toplevel()
+    archive_window.title("Archived Sets")
+    archive_window.geometry(configure_size(archive_window))
+    archive_window.configure(bg='#00173c')
+
+    tk.Label(
+        archive_window, text="Completed sets moved out of the collection",
+        font=('Arial', 10), bg='#00173c', fg='white'
+    ).pack(padx=10, pady=5)
+
+    set_list = tk.Listbox(archive_window, width=50, height=8)
+    set_list.pack(fill="x", padx=10, pady=5)
+
+    button_frame = tk.Frame(archive_window, bg='#00173c')
+    button_frame.pack(pady=5)
+
+    parts_box = tk.Text(archive_window, width=80, height=20, state='disabled')
+    parts_box.pack(fill="both", expand=True, padx=10, pady=5)
+
+    archived: List[str] = []
+
+    # Keep the list current as sets are archived or restored
+    def refresh_sets(**event):
+        archived[:] = list_archived_sets(set_data_dir)
+        set_list.delete(0, tk.END)
+        for set_title in archived:
+            set_list.insert(tk.END, set_title)
+    refresh_sets()
+    unsubscribe = state_bus.subscribe("sets_changed", refresh_sets)
+
+    def selected_set():
+        selection = set_list.curselection()
+        return archived[selection[0]] if selection else None
+
+    # Decompress the selected set just to show its parts
+    def view_selected():
+        set_title = selected_set()
+        if set_title is None:
+            return
+        try:
+            data = read_archived_set(set_title, set_data_dir)
+        except (KeyError, OSError, json.JSONDecodeError) as e:
+            messagebox.showerror(
+                "Error", f"Could not read {set_title}: {e}",
+                parent=archive_window
+            )
+            return
+        parts_box.config(state='normal')
+        parts_box.delete("1.0", tk.END)
+        parts_box.insert("1.0", describe_archived_set(set_title, data))
+        parts_box.config(state='disabled')
+
+    # Move the selected set back into the collection to edit it again
+    def restore_selected():
+        set_title = selected_set()
+        if set_title is None:
+            return
+        try:
+            restore_set(set_title, set_data_dir)
+        except Exception as e:
+            messagebox.showerror("Error", str(e), parent=archive_window)
+            return
+        parts_box.config(state='normal')
+        parts_box.delete("1.0", tk.END)
+        parts_box.config(state='disabled')
+        messagebox.showinfo(
+            "Restored", f"{set_title} is back in the collection.",
+            parent=archive_window
+        )
+
+    set_list.bind("<Double-Button-1>", lambda e: view_selected())
+    tk.Button(
+        button_frame, text="View", command=view_selected,
+        font=('Arial', 12, 'bold'), bg='#30ce30', fg='white',
+        padx=10, pady=2, cursor='hand2'
+    ).pack(side="left", padx=5)
+    tk.Button(
+        button_frame, text="Restore", command=restore_selected,
+        font=('Arial', 12, 'bold'), bg='#309bff', fg='white',
+        padx=10, pady=2, cursor='hand2'
+    ).pack(side="left", padx=5)
+
+    def on_destroy(event):
+        if event.widget is archive_window:
+            unsubscribe()
+    archive_window.bind("<Destroy>", on_destroy)
@@ -0,0 +1,161 @@
+import tkinter as tk
+from PIL import ImageTk
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# This draws a grid of part cells directly as items on one Canvas, so a
+# cell costs a few canvas items instead of a tree of widgets.
+class CanvasGrid:
+    def __init__(
+        self,
+        canvas: tk.Canvas,
+        columns: int,
+        cell_width: int,
+        cell_height: int,
+        gap: int = 4,
+        top: int = 0
+    ) -> None:
+
+        self.canvas = canvas
+        self.columns = columns
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.gap = gap
+        self.top = top
+
+        # Item IDs and position of every cell, by cell index
+        self.cells: List[Dict[str, Any]] = []
+        self.photos: List[ImageTk.PhotoImage] = []
+
+    # Top-left corner of a grid position
+    def position_xy(self, position: int) -> Tuple[int, int]:
+        row, col = divmod(position, self.columns)
+        x = self.gap + col * (self.cell_width + self.gap)
+        y = self.top + self.gap + row * (self.cell_height + self.gap)
+        return x, y
+
+    # Start a new cell with its background, returning the cell index
+    def add_cell(self, fill: str) -> int:
+        index = len(self.cells)
+        x, y = self.position_xy(index)
+        tag = f"cell{index}"
+        rect = self.canvas.create_rectangle(
+            x, y, x + self.cell_width, y + self.cell_height,
+            fill=fill, outline='', width=0, tags=("cell", tag)
+        )
+        self.cells.append({
+            'tag': tag, 'rect': rect, 'position': index, 'texts': {}
+        })
+        return index
+
+    # Draw an image, or a placeholder if there is none, inside a cell
+    def add_image(
+        self,
+        index: int,
+        x: int,
+        y: int,
+        photo: Optional[ImageTk.PhotoImage],
+        size: int
+    ) -> None:
+
+        cell = self.cells[index]
+        left, top = self.position_xy(cell['position'])
+        if photo is not None:
+            self.photos.append(photo)
+            self.canvas.create_image(
+                left + x, top + y, image=photo, anchor="nw", tags=cell['tag']
+            )
+        else:
+            self.canvas.create_rectangle(
+                left + x, top + y, left + x + size, top + y + size,
+                fill='lightgray', outline='black', tags=cell['tag']
+            )
+            self.canvas.create_text(
+                left + x + size // 2, top + y + size // 2, text="IMG",
+                font=('Arial', 8), tags=cell['tag']
+            )
+
+    # Draw a named text item inside a cell
+    def add_text(
+        self,
+        index: int,
+        name: str,
+        x: int,
+        y: int,
+        text: str,
+        font: Any,
+        width: int = 0
+    ) -> None:
+
+        cell = self.cells[index]
+        left, top = self.position_xy(cell['position'])
+        cell['texts'][name] = self.canvas.create_text(
+            left + x, top + y, text=text, font=font, anchor="nw",
+            width=width, tags=cell['tag']
+        )
+
+    # Move every item of a cell to a new grid position
+    def move_cell(self, index: int, position: int) -> None:
+        cell = self.cells[index]
+        if cell['position'] == position:
+            return
+        old_x, old_y = self.position_xy(cell['position'])
+        new_x, new_y = self.position_xy(position)
+        self.canvas.move(cell['tag'], new_x - old_x, new_y - old_y)
+        cell['position'] = position
+
+    def set_visible(self, index: int, visible: bool) -> None:
+        self.canvas.itemconfigure(
+            self.cells[index]['tag'], state='normal' if visible else 'hidden'
+        )
+
+    def is_visible(self, index: int) -> bool:
+        state = self.canvas.itemcget(self.cells[index]['rect'], 'state')
+        return state != 'hidden'
+
+    def set_fill(self, index: int, color: str) -> None:
+        self.canvas.itemconfigure(self.cells[index]['rect'], fill=color)
+
+    def set_outline(self, index: int, color: Optional[str]) -> None:
+        self.canvas.itemconfigure(
+            self.cells[index]['rect'],
+            outline=color or '', width=3 if color else 0
+        )
+
+    def set_text(self, index: int, name: str, text: str) -> None:
+        self.canvas.itemconfigure(self.cells[index]['texts'][name], text=text)
+
+    # Canvas coordinates of a named text item
+    def text_xy(self, index: int, name: str) -> Tuple[float, float]:
+        x, y = self.canvas.coords(self.cells[index]['texts'][name])
+        return x, y
+
+    # Index of the visible cell under a mouse event, if any
+    def index_at(self, event: tk.Event) -> Optional[int]:
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        for item in reversed(self.canvas.find_overlapping(x, y, x, y)):
+            if self.canvas.itemcget(item, 'state') == 'hidden':
+                continue
+            for tag in self.canvas.gettags(item):
+                if tag.startswith("cell") and tag[4:].isdigit():
+                    return int(tag[4:])
+        return None
+
+    # Y coordinate just below the lowest visible cell
+    def bottom(self) -> int:
+        positions = [
+            cell['position'] for i, cell in enumerate(self.cells)
+            if self.is_visible(i)
+        ]
+        if not positions:
+            return self.top
+        return self.position_xy(max(positions))[1] + self.cell_height
+
+    # Remove every cell from the canvas
+    def clear(self) -> None:
+        self.canvas.delete("cell")
+        for cell in self.cells:
+            self.canvas.delete(cell['tag'])
+        self.cells.clear()
+        self.photos.clear()
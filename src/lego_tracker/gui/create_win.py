@@ -1,25 +1,34 @@
 import json
 import os
 import requests
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
+from ..archive import list_archived_sets
+from ..set_files import (
+    set_writer, 
+    split_into_search_words, 
+    write_json_atomic,
+)
 from ..settings import REBRICKABLE_API_KEY
+from ..state_bus import state_bus
 
 
-# Split text into individual words for searching
-def split_into_search_words(text: Optional[str]) -> List[str]:
-    import re
-    if not text:
-        return []
-    # Split on spaces, commas, parentheses, and other common delimiters
-    words = re.split(r'[\s,\(\)\[\]\/\-]+', text.lower())
-    return [word.strip() for word in words if word.strip()]
-
-# This gets comprehensive set information from the Rebrickable API
-def get_set_info(set_id: str) -> Dict[str, Any]:
+# This gets comprehensive set information from the Rebrickable API.
+# Lists already downloaded, e.g. while checking for changes, can be given
+# in responses by URL so they are not fetched again.
+def get_set_info(
+    set_id: str, 
+    responses: Optional[Dict[str, requests.Response]] = None
+) -> Dict[str, Any]:
+    
     # Get basic set information
     set_url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/"
     headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
+
+    def fetch(url: str) -> requests.Response:
+        if responses and url in responses:
+            return responses[url]
+        return requests.get(url, headers=headers)
     
     set_response = requests.get(set_url, headers=headers)
     if set_response.status_code != 200:
@@ -29,7 +38,7 @@ def get_set_info(set_id: str) -> Dict[str, Any]:
 
     # Get regular parts list, excluding spares
     parts_url = f"{set_url}parts/?page_size=1000"
-    parts_response = requests.get(parts_url, headers=headers)
+    parts_response = fetch(parts_url)
     if parts_response.status_code != 200:
         raise Exception("Failed to fetch parts data from Rebrickable API")
     
@@ -66,7 +75,7 @@ def get_set_info(set_id: str) -> Dict[str, Any]:
 
     # Get minifigure parts and merge duplicates
     minifigs_url = f"{set_url}minifigs/?page_size=1000"
-    minifigs_response = requests.get(minifigs_url, headers=headers)
+    minifigs_response = fetch(minifigs_url)
     minifig_parts = {}
 
     if minifigs_response.status_code != 200:
@@ -82,7 +91,7 @@ def get_set_info(set_id: str) -> Dict[str, Any]:
             f"https://rebrickable.com/api/v3/lego/minifigs/{minifig_code}/"
             f"parts/?page_size=1000"
         )
-        minifig_response = requests.get(minifig_parts_url, headers=headers)
+        minifig_response = fetch(minifig_parts_url)
         parts_data = minifig_response.json()["results"]
 
         # Add each part (multiplied by minifig quantity and part quantity)
@@ -132,40 +141,14 @@ def get_set_info(set_id: str) -> Dict[str, Any]:
     }
 
 
-# This creates a new .txt file for a set.
-def create_new_set(set_id: str, set_data_dir: str = 'set_data') -> None:
-    # Get set information
-    api_data = get_set_info(set_id)
-    set_info = api_data["set_info"]
-    parts = api_data["parts"]
-    stickers = api_data["stickers"]
-
-    # Sanitize set name just in case
-    set_name = set_info["name"]
-    safe_name = "".join(
-        c for c in set_name if c.isalnum() or c in (' ', '-', '_')
-    ).rstrip()
-
-    # Create the new file, unless it already exists
-    set_filename = os.path.join(set_data_dir, f"{set_id} - {safe_name}.txt")
-    if os.path.exists(set_filename):
-        raise Exception("Set already exists.")
+# This turns parts and stickers from the API into stored set entries.
+def build_set_entries(
+    parts: List[Dict[str, Any]], 
+    stickers: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     
-    # Store the set data
-    set_data = {
-        "set_info": {
-            "set_id": set_id,
-            "name": set_name,
-            "year": set_info.get("year"),
-            "num_parts": set_info.get("num_parts"),
-            "set_img_url": set_info.get("set_img_url"),
-            "completed": False,
-            "parts_found": 0,
-            "notes": ""
-        },
-        "parts": [],
-        "stickers": []
-    }
+    part_entries: List[Dict[str, Any]] = []
+    sticker_entries: List[Dict[str, Any]] = []
 
     # Process parts
     for part in parts:
@@ -179,7 +162,7 @@ def create_new_set(set_id: str, set_data_dir: str = 'set_data') -> None:
         all_search_text = f"{part_id} {part_name} {part_category} {part_color}"
         search_words = split_into_search_words(all_search_text)
         
-        set_data["parts"].append({
+        part_entries.append({
             "id": part_id,
             "name": part_name,
             "category": part_category,
@@ -201,7 +184,7 @@ def create_new_set(set_id: str, set_data_dir: str = 'set_data') -> None:
         all_searchable_text = f"{sticker_id} {sticker_name} {sticker_category} {sticker_color}"
         search_words = split_into_search_words(all_searchable_text)
         
-        set_data["stickers"].append({
+        sticker_entries.append({
             "id": sticker_id,
             "name": sticker_name,
             "category": sticker_category,
@@ -211,5 +194,242 @@ def create_new_set(set_id: str, set_data_dir: str = 'set_data') -> None:
             "search_words": search_words
         })
 
-    with open(set_filename, 'w') as f:
-        json.dump(set_data, f, indent=2)
\ No newline at end of file
+    return part_entries, sticker_entries
+
+
+# This creates a new .txt file for a set.
+def create_new_set(set_id: str, set_data_dir: str = 'set_data') -> None:
+    # Get set information
+    api_data = get_set_info(set_id)
+    set_info = api_data["set_info"]
+    parts = api_data["parts"]
+    stickers = api_data["stickers"]
+
+    # Sanitize set name just in case
+    set_name = set_info["name"]
+    safe_name = "".join(
+        c for c in set_name if c.isalnum() or c in (' ', '-', '_')
+    ).rstrip()
+
+    # Create the new file, unless it already exists
+    set_filename = os.path.join(set_data_dir, f"{set_id} - {safe_name}.txt")
+    if os.path.exists(set_filename):
+        raise Exception("Set already exists.")
+    if f"{set_id} - {safe_name}" in list_archived_sets(set_data_dir):
+        raise Exception("Set is archived; restore it instead.")
+    
+    # Store the set data
+    part_entries, sticker_entries = build_set_entries(parts, stickers)
+    set_data = {
+        "set_info": {
+            "set_id": set_id,
+            "name": set_name,
+            "year": set_info.get("year"),
+            "num_parts": set_info.get("num_parts"),
+            "set_img_url": set_info.get("set_img_url"),
+            "completed": False,
+            "parts_found": 0,
+            "notes": ""
+        },
+        "parts": part_entries,
+        "stickers": sticker_entries
+    }
+
+    write_json_atomic(set_filename, set_data)
+    state_bus.publish("sets_changed", set_data_dir=set_data_dir)
+
+
+# This checks whether a set's inventory changed since the stored ETags,
+# using conditional requests so unchanged inventories cost no download.
+# Each minifig's own parts list is checked too, as it can change while
+# the set's lists stay the same. Lists that were downloaded are kept in
+# responses by URL, for get_set_info to reuse.
+def inventory_changed(
+    set_id: str, 
+    etags: Dict[str, str], 
+    responses: Optional[Dict[str, requests.Response]] = None
+) -> bool:
+    
+    if responses is None:
+        responses = {}
+    set_url = f"https://rebrickable.com/api/v3/lego/sets/{set_id}/"
+    minifig_url = "https://rebrickable.com/api/v3/lego/minifigs/"
+    headers = {"Authorization": f"key {REBRICKABLE_API_KEY}"}
+    changed = False
+
+    # Fetch a list unless it matches its ETag, returning None if it does
+    def fetch_changed(url: str) -> Optional[requests.Response]:
+        nonlocal changed
+        request_headers = dict(headers)
+        if etags.get(url):
+            request_headers["If-None-Match"] = etags[url]
+
+        response = requests.get(url, headers=request_headers)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise Exception("Failed to check inventory on Rebrickable API")
+
+        # Lists without an ETag are still recorded, and always refetched
+        changed = True
+        etags[url] = response.headers.get("ETag", "")
+        responses[url] = response
+        return response
+
+    fetch_changed(f"{set_url}parts/?page_size=1000")
+    minifigs_list_url = f"{set_url}minifigs/?page_size=1000"
+    response = fetch_changed(minifigs_list_url)
+    minifig_etags = [url for url in etags if url.startswith(minifig_url)]
+
+    # Minifigs checked before their parts lists were recorded are read
+    # again, without counting as a change
+    if response is None and not minifig_etags:
+        response = requests.get(minifigs_list_url, headers=headers)
+        if response.status_code != 200:
+            raise Exception("Failed to check inventory on Rebrickable API")
+        responses[minifigs_list_url] = response
+
+    if response is None:
+        minifig_parts_urls = minifig_etags
+    else:
+        minifig_parts_urls = [
+            f"{minifig_url}{minifig['set_num']}/parts/?page_size=1000"
+            for minifig in response.json()["results"]
+        ]
+        for url in minifig_etags:
+            if url not in minifig_parts_urls:
+                del etags[url]
+
+    for url in minifig_parts_urls:
+        fetch_changed(url)
+    return changed
+
+
+# This merges a fresh inventory into stored entries by (ID, color),
+# keeping "have" counts and reporting what changed.
+def diff_inventory(
+    old_entries: List[Dict[str, Any]], 
+    new_entries: List[Dict[str, Any]], 
+    count_field: str = "need"
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
+    
+    # The same (ID, color) can appear more than once, so match in order
+    old_by_key: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for entry in old_entries:
+        key = (entry["id"], entry["color"])
+        old_by_key.setdefault(key, []).append(entry)
+
+    changes: Dict[str, List[str]] = {"added": [], "removed": [], "changed": []}
+    merged: List[Dict[str, Any]] = []
+    for entry in new_entries:
+        key = (entry["id"], entry["color"])
+        label = f"{entry['id']} ({entry['color']})"
+        matches = old_by_key.get(key)
+        if not matches:
+            changes["added"].append(f"{label} x{entry[count_field]}")
+            merged.append(entry)
+            continue
+
+        old_entry = matches.pop(0)
+        if old_entry[count_field] != entry[count_field]:
+            changes["changed"].append(
+                f"{label}: {old_entry[count_field]} -> {entry[count_field]}"
+            )
+        if "have" in old_entry:
+            entry["have"] = min(old_entry["have"], entry[count_field])
+        merged.append(entry)
+
+    for matches in old_by_key.values():
+        for old_entry in matches:
+            changes["removed"].append(
+                f"{old_entry['id']} ({old_entry['color']}) "
+                f"x{old_entry[count_field]}"
+            )
+    return merged, changes
+
+
+# This updates a tracked set to match its current Rebrickable inventory.
+def resync_set(
+    set_title: str, 
+    set_data_dir: str = 'set_data', 
+    dry_run: bool = False
+) -> Dict[str, List[str]]:
+    
+    # Queued edits must be on disk before the file is rewritten
+    set_writer.flush(set_title, set_data_dir)
+    filepath = os.path.join(set_data_dir, f"{set_title}.txt")
+    with open(filepath, 'r') as f:
+        set_data = json.load(f)
+
+    set_info = set_data["set_info"]
+    etags = dict(set_info.get("etags", {}))
+    responses: Dict[str, requests.Response] = {}
+    if not inventory_changed(set_info["set_id"], etags, responses):
+        return {}
+
+    # Lists downloaded by the check are not fetched a second time
+    api_data = get_set_info(set_info["set_id"], responses)
+    part_entries, sticker_entries = build_set_entries(
+        api_data["parts"], api_data["stickers"]
+    )
+    set_data["parts"], changes = diff_inventory(
+        set_data["parts"], part_entries
+    )
+    set_data["stickers"], sticker_changes = diff_inventory(
+        set_data["stickers"], sticker_entries, "quantity"
+    )
+    for change_type, items in sticker_changes.items():
+        changes[change_type].extend(items)
+
+    if not dry_run:
+        set_info["etags"] = etags
+        set_info["num_parts"] = api_data["set_info"].get(
+            "num_parts", set_info.get("num_parts")
+        )
+        set_info["completed"] = all(
+            part["have"] >= part["need"] for part in set_data["parts"]
+        )
+        set_info["parts_found"] = sum(
+            part["have"] for part in set_data["parts"]
+        )
+        write_json_atomic(filepath, set_data)
+        state_bus.publish(
+            "set_replaced", set_title=set_title, set_data_dir=set_data_dir
+        )
+    return changes
+
+
+# This re-syncs every tracked set, returning the changes for each one.
+def resync_all_sets(
+    set_data_dir: str = 'set_data', 
+    dry_run: bool = False
+) -> Dict[str, Dict[str, List[str]]]:
+    
+    results: Dict[str, Dict[str, List[str]]] = {}
+    for set_file in sorted(os.listdir(set_data_dir)):
+        if not set_file.endswith('.txt'):
+            continue
+        set_title = set_file[:-4]
+
+        # One failed set should not stop the rest from syncing
+        try:
+            results[set_title] = resync_set(set_title, set_data_dir, dry_run)
+        except Exception as e:
+            results[set_title] = {"error": [str(e)]}
+    return results
+
+
+# This formats the changes from a re-sync as readable text.
+def describe_resync(set_title: str, changes: Dict[str, List[str]]) -> str:
+    if not changes:
+        return f"{set_title}: inventory unchanged."
+    if "error" in changes:
+        return f"{set_title}: failed ({changes['error'][0]})"
+    if not any(changes.values()):
+        return f"{set_title}: inventory matches."
+
+    lines = [f"{set_title}:"]
+    for change_type in ("added", "removed", "changed"):
+        for item in changes.get(change_type, []):
+            lines.append(f"    {change_type}: {item}")
+    return "\n".join(lines)
@@ -0,0 +1,163 @@
+import io
+import json
+import os
+import urllib.request
+from PIL import Image, ImageTk
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from ..set_files import write_json_atomic
+
+# Thumbnails are packed into fixed-size sheets laid out row by row
+SHEET_COLUMNS = 32
+SHEET_CAPACITY = SHEET_COLUMNS * SHEET_COLUMNS
+ATLAS_DIR_NAME = '.atlas'
+
+
+# This downloads an image and resizes it into a square thumbnail.
+def fetch_thumbnail(url: Optional[str], size: int) -> Optional[Image.Image]:
+    if not url:
+        return None
+    try:
+        with urllib.request.urlopen(url) as response:
+            img_data = response.read()
+        pil_image = Image.open(io.BytesIO(img_data)).convert('RGBA')
+        return pil_image.resize((size, size), Image.Resampling.LANCZOS)
+    except Exception:
+        return None
+
+
+# This stores thumbnails of one size in packed sheets with an offset index.
+class ThumbnailAtlas:
+    def __init__(self, size: int, set_data_dir: str = 'set_data') -> None:
+        self.size = size
+        self.atlas_dir = os.path.join(set_data_dir, ATLAS_DIR_NAME)
+        self.index_path = os.path.join(self.atlas_dir, f"thumbs_{size}.json")
+
+        # Maps image URL to its slot number across all sheets
+        self.slots: Dict[str, int] = {}
+        self.sheets: Dict[int, Image.Image] = {}
+        self.photos: Dict[str, ImageTk.PhotoImage] = {}
+        # Number of times each photo is currently held by a window
+        self.refs: Dict[str, int] = {}
+        self.failed: Set[str] = set()
+        self.dirty_sheets: Set[int] = set()
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.slots = json.load(f)["slots"]
+            except (json.JSONDecodeError, KeyError):
+                self.slots = {}
+
+    def _sheet_path(self, sheet_num: int) -> str:
+        return os.path.join(
+            self.atlas_dir, f"thumbs_{self.size}_{sheet_num}.png"
+        )
+
+    # Pixel box of a slot within its sheet
+    def _slot_box(self, slot: int) -> Tuple[int, int, int, int, int]:
+        sheet_num, pos = divmod(slot, SHEET_CAPACITY)
+        x = (pos % SHEET_COLUMNS) * self.size
+        y = (pos // SHEET_COLUMNS) * self.size
+        return sheet_num, x, y, x + self.size, y + self.size
+
+    # Decode each sheet at most once per session
+    def _get_sheet(self, sheet_num: int) -> Image.Image:
+        if sheet_num not in self.sheets:
+            path = self._sheet_path(sheet_num)
+            if os.path.exists(path):
+                with Image.open(path) as sheet:
+                    self.sheets[sheet_num] = sheet.convert('RGBA')
+            else:
+                sheet_px = SHEET_COLUMNS * self.size
+                self.sheets[sheet_num] = Image.new(
+                    'RGBA', (sheet_px, sheet_px), (0, 0, 0, 0)
+                )
+        return self.sheets[sheet_num]
+
+    def _add(self, url: str, thumbnail: Image.Image) -> None:
+        slot = len(self.slots)
+        sheet_num, x, y, _, _ = self._slot_box(slot)
+        self._get_sheet(sheet_num).paste(thumbnail, (x, y))
+        self.slots[url] = slot
+        self.dirty_sheets.add(sheet_num)
+
+    # Download every missing thumbnail, then write the sheets once
+    def prefetch(self, urls: Iterable[Optional[str]]) -> None:
+        for url in urls:
+            if not url or url in self.slots or url in self.failed:
+                continue
+            thumbnail = fetch_thumbnail(url, self.size)
+            if thumbnail is None:
+                self.failed.add(url)
+            else:
+                self._add(url, thumbnail)
+        self.flush()
+
+    # Write any changed sheets and the index to disk
+    def flush(self) -> None:
+        if not self.dirty_sheets:
+            return
+        os.makedirs(self.atlas_dir, exist_ok=True)
+        for sheet_num in self.dirty_sheets:
+            path = self._sheet_path(sheet_num)
+            self.sheets[sheet_num].save(f"{path}.tmp", format='PNG')
+            os.replace(f"{path}.tmp", path)
+        write_json_atomic(
+            self.index_path, {"size": self.size, "slots": self.slots}, None
+        )
+        self.dirty_sheets.clear()
+
+    # Returns the thumbnail for the URL, or None if unavailable
+    def get_image(self, url: Optional[str]) -> Optional[Image.Image]:
+        if not url:
+            return None
+        if url not in self.slots:
+            self.prefetch([url])
+            if url not in self.slots:
+                return None
+
+        sheet_num, *box = self._slot_box(self.slots[url])
+        return self._get_sheet(sheet_num).crop(box)
+
+    # Returns a shared PhotoImage for the URL, or None if unavailable
+    def get_photo(self, url: Optional[str]) -> Optional[ImageTk.PhotoImage]:
+        if not url:
+            return None
+        if url in self.photos:
+            return self.photos[url]
+
+        image = self.get_image(url)
+        if image is None:
+            return None
+        photo = ImageTk.PhotoImage(image)
+        self.photos[url] = photo
+        return photo
+
+    # Returns the photo like get_photo, holding it until it is released
+    def acquire(self, url: Optional[str]) -> Optional[ImageTk.PhotoImage]:
+        photo = self.get_photo(url)
+        if photo is not None:
+            self.refs[url] = self.refs.get(url, 0) + 1
+        return photo
+
+    # Give back one hold per URL, dropping the Tk images no window holds
+    # any more so their memory can be freed
+    def release(self, urls: Iterable[Optional[str]]) -> None:
+        for url in urls:
+            if url not in self.refs:
+                continue
+            self.refs[url] -= 1
+            if self.refs[url] == 0:
+                del self.refs[url]
+                self.photos.pop(url, None)
+
+
+# One atlas per thumbnail size and data directory is shared by all windows
+_atlases: Dict[Tuple[str, int], ThumbnailAtlas] = {}
+
+def get_atlas(size: int, set_data_dir: str = 'set_data') -> ThumbnailAtlas:
+    key = (os.path.abspath(set_data_dir), size)
+    if key not in _atlases:
+        _atlases[key] = ThumbnailAtlas(size, set_data_dir)
+    return _atlases[key]
@@ -1,12 +1,23 @@
-import io
 import json
 import os
 import tkinter as tk
-import urllib.request
-from PIL import Image, ImageTk
-from tkinter import messagebox, ttk
-from typing import List, Dict, Any, Tuple
-
+from tkinter import font as tkfont, messagebox, ttk
+from typing import List, Dict, Any, Set, Tuple
+
+from ..allocation import PartKey, parse_part_lines, part_key
+from ..archive import archive_set, should_archive
+from ..search import natural_key
+from ..set_files import (
+    apply_have_changes, 
+    have_change_events, 
+    iter_set_file, 
+    set_writer,
+)
+from ..state_bus import state_bus
+from ..transfer import Update, resolve_updates
+from .canvas_grid import CanvasGrid
+from .image_atlas import get_atlas
+from .window_pool import WindowPool
 from .win_helpers import (
     configure_size, 
     on_mousewheel, 
@@ -14,39 +25,110 @@ from .win_helpers import (
 )
 
 
-# This loads the data from a set ID's .txt file.
-def load_set_data(
-        set_title: str, 
-        set_data_dir: str = 'set_data'
-) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+# Closed load windows are kept hidden for a while to reopen instantly
+window_pool = WindowPool()
+
+
+# This turns pasted "ID, color, count" lines into a batch of changes.
+# Counts for a part listed more than once in the set are spread over its
+# entries, as imports do.
+def parse_count_list(
+    text: str, 
+    parts_data: List[Dict[str, Any]]
+) -> Tuple[Dict[int, int], List[str]]:
     
-    with open(os.path.join(set_data_dir, f"{set_title}.txt"), 'r') as f:
-        data = json.load(f)
-    return data["parts"], data["stickers"]
+    # Index the (ID, color) keys of each ID for lines without a color
+    keys_by_id: Dict[str, Set[PartKey]] = {}
+    for part in parts_data:
+        key = part_key(part['id'], part['color'])
+        keys_by_id.setdefault(key[0], set()).add(key)
+
+    lines, errors = parse_part_lines(text)
+    set_updates: Dict[PartKey, List[Update]] = {}
+    for line_num, part_id, color, count, relative in lines:
+        # Without a color, the ID must name a single (ID, color) key
+        if color is None:
+            keys = keys_by_id.get(part_id.lower(), set())
+            if len(keys) > 1:
+                errors.append(f"Line {line_num}: {part_id} needs a color.")
+                continue
+            key = next(iter(keys), None)
+        else:
+            key = part_key(part_id, color)
+            if key not in keys_by_id.get(key[0], set()):
+                key = None
 
+        if key is None:
+            errors.append(f"Line {line_num}: {part_id} is not in this set.")
+            continue
 
-# This saves any updates to the set's data.
-def save_set_data(
-    set_title: str, 
+        # A leading "+" or "-" adjusts the count instead of replacing it
+        mode = "add" if relative else "set"
+        set_updates.setdefault(key, []).append((mode, count))
+
+    return resolve_updates(parts_data, set_updates), errors
+
+
+# Ways the load window can order and group parts
+SORT_MODES = ["Set Order", "Remaining", "Color", "Category", "Part ID"]
+GROUP_MODES = ["No Grouping", "Color", "Category"]
+ALL_FILTER = "All"
+
+
+# This precomputes the sort keys of every part once per window.
+def build_sort_keys(parts_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    sort_keys = []
+    for i, part in enumerate(parts_data):
+        id_key = natural_key(part['id'])
+        sort_keys.append({
+            "Set Order": i,
+            "Color": (part['color'].lower(), id_key),
+            "Category": (part['category'].lower(), id_key),
+            "Part ID": (id_key, part['color'].lower())
+        })
+    return sort_keys
+
+
+# This filters, groups and sorts parts, returning their indices per group.
+def arrange_parts(
     parts_data: List[Dict[str, Any]], 
-    set_data_dir: str = 'set_data'
-) -> None:
-    
-    filepath = os.path.join(set_data_dir, f"{set_title}.txt")
+    sort_keys: List[Dict[str, Any]], 
+    sort_mode: str = "Set Order", 
+    group_mode: str = "No Grouping", 
+    incomplete_only: bool = False, 
+    color: str = ALL_FILTER, 
+    category: str = ALL_FILTER
+) -> List[List[int]]:
     
-    # Load existing data to preserve set_info and stickers
-    with open(filepath, 'r') as f:
-        existing_data = json.load(f)
+    shown = [
+        i for i, part in enumerate(parts_data)
+        if not (incomplete_only and part['have'] >= part['need'])
+        and color in (ALL_FILTER, part['color'])
+        and category in (ALL_FILTER, part['category'])
+    ]
+
+    # Remaining counts change with every edit, so they are never cached
+    if sort_mode == "Remaining":
+        shown.sort(key=lambda i: (
+            parts_data[i]['have'] - parts_data[i]['need'], 
+            sort_keys[i]["Part ID"]
+        ))
+    else:
+        shown.sort(key=lambda i: sort_keys[i][sort_mode])
 
-    # Update the parts data
-    existing_data["parts"] = parts_data
+    if group_mode not in ("Color", "Category"):
+        return [shown] if shown else []
 
-    # Check if set is complete or incomplete
-    all_complete = all(part["have"] >= part["need"] for part in parts_data)
-    existing_data["set_info"]["completed"] = all_complete
+    field = group_mode.lower()
+    groups: Dict[str, List[int]] = {}
+    for i in shown:
+        groups.setdefault(parts_data[i][field], []).append(i)
+    return [groups[name] for name in sorted(groups, key=str.lower)]
 
-    with open(filepath, 'w') as f:
-        json.dump(existing_data, f, indent=2)
+
+# Parts drawn before the window first appears, then per step after that
+FIRST_BATCH = 100
+LOAD_BATCH = 250
 
 
 # This shows a list of the part data from a specific set.
@@ -56,13 +138,70 @@ def show_set_grid(
         set_data_dir: str = 'set_data'
 ) -> None:
     
-    parts_data, stickers_data = load_set_data(set_title, set_data_dir)
+    # Write any queued changes first so the file is current
+    set_writer.flush(set_title, set_data_dir)
+
+    # A recently closed window for this set is simply shown again
+    file_path = os.path.join(set_data_dir, f"{set_title}.txt")
+    pool_key = (os.path.abspath(set_data_dir), set_title)
+    if window_pool.take(pool_key) is not None:
+        return
+
+    # Parts are read from the file as the grid is drawn, leaving out the
+    # search words the window never shows
+    stream = iter_set_file(file_path, skip_fields=['search_words'])
+    parts_data: List[Dict[str, Any]] = []
+    stickers_data: List[Dict[str, Any]] = []
+
+    # Read parts until there are `count`, returning True at the end
+    def read_parts(count):
+        while len(parts_data) < count:
+            item = next(stream, None)
+            if item is None:
+                return True
+            key, value = item
+            if key == 'parts':
+                parts_data.append(value)
+            elif key == 'stickers':
+                stickers_data.append(value)
+        return False
+
+    # Fill the first screen before the window opens
+    loading = not read_parts(FIRST_BATCH)
 
     load_window = tk.Toplevel()
     load_window.title(f"Viewing Set: {set_title}")
     load_window.geometry(configure_size(load_window))
     load_window.configure(bg='#00173c')
 
+    # Write any queued updates, then hide the window for a quick reopen
+    def close_window():
+        close_editor()
+        set_writer.flush(set_title, set_data_dir)
+        if loading:
+            load_window.destroy()
+            return
+
+        # A set saved complete moves to the archive instead of being kept
+        if should_archive(set_title, set_data_dir):
+            try:
+                archive_set(set_title, set_data_dir)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Could not archive set {set_title}: {e}")
+            else:
+                load_window.destroy()
+                return
+        window_pool.put(pool_key, load_window, file_path)
+    load_window.protocol("WM_DELETE_WINDOW", close_window)
+
+    # Toolbar for bulk edits at the top
+    toolbar = tk.Frame(load_window, bg='#00173c')
+    toolbar.pack(pady=5)
+
+    # Controls for sorting, grouping and filtering below it
+    view_bar = tk.Frame(load_window, bg='#00173c')
+    view_bar.pack(pady=(0, 5))
+
     # Create main frame with both vertical and horizontal scrollbars
     main_frame = tk.Frame(load_window, bg='#00173c')
     main_frame.pack(fill="both", expand=True)
@@ -85,9 +224,9 @@ def show_set_grid(
     v_scrollbar.config(command=canvas.yview)
     h_scrollbar.config(command=canvas.xview)
 
-    # Frame to hold the grid content
+    # Frame below the parts for the stickers and Back button
     content_frame = tk.Frame(canvas, bg='#00173c')
-    canvas.create_window((0, 0), window=content_frame, anchor="nw")
+    footer = canvas.create_window((0, 0), window=content_frame, anchor="nw")
 
     # Mouse wheel scrolling
     canvas.bind(
@@ -103,42 +242,165 @@ def show_set_grid(
         "<Shift-MouseWheel>", lambda event: on_shift_mousewheel(canvas, event)
     )
 
-    # Set boundaries for the scrollbars
-    def on_configure(event):
-        canvas.configure(scrollregion=canvas.bbox("all"))
+    id_font = tkfont.Font(family='Arial', size=10, weight='bold')
+    text_font = tkfont.Font(family='Arial', size=10)
+    have_font = tkfont.Font(family='Arial', size=10, underline=True)
+
+    # Size cells to fit the longest ID, color and count read so far
+    def measure_layout():
+        text_width = max(
+            [id_font.measure(f"ID: {part['id']}") for part in parts_data] + 
+            [
+                text_font.measure(f"Color: {part['color']}") 
+                for part in parts_data
+            ] + [0]
+        )
+        count_x = 62 + text_width + 12
+        have_x = count_x + text_font.measure("Have: ")
+        count_width = max(
+            [
+                text_font.measure(f"Need: {part['need']}") 
+                for part in parts_data
+            ] + [have_x - count_x + text_font.measure("0000")]
+        )
+        return {
+            'count_x': count_x, 
+            'have_x': have_x, 
+            'cell_width': max(300, count_x + count_width + 8)
+        }
+    layout = measure_layout()
+
+    # Every part is drawn as a few items on the canvas itself
+    grid = CanvasGrid(canvas, columns, layout['cell_width'], 60)
+
+    # Set boundaries for the scrollbars, keeping the footer below the parts
+    def on_configure(event=None):
+        top = grid.bottom() + 10
+        canvas.coords(footer, 0, top)
+        width = max(
+            grid.position_xy(columns - 1)[0] + grid.cell_width + grid.gap, 
+            content_frame.winfo_reqwidth()
+        )
+        height = top + content_frame.winfo_reqheight()
+        canvas.configure(scrollregion=(0, 0, width, height))
     content_frame.bind("<Configure>", on_configure)
 
-    # Revert changes from invalid entry
-    def delete_and_reinsert(entry, index):
-        entry.delete(0, tk.END)
-        entry.insert(0, str(parts_data[index]['have']))
+    # Background of each part's cell, plus the selection and undo history
+    orig_colors: List[str] = []
+    selected: set = set()
+    undo_stack: List[Dict[int, int]] = []
 
     # Check if part is completed and show/hide highlight
-    def update_highlight(part_data, bg_frame, text_widgets, orig_color):
+    def update_highlight(index):
+        part_data = parts_data[index]
         if part_data['have'] == part_data['need']:
-            highlight_color = '#90ee90'
-            bg_frame.config(bg=highlight_color, bd=0, relief='solid')
+            grid.set_fill(index, '#90ee90')
         elif part_data['have'] > 0:
-            highlight_color = '#ffff90'
-            bg_frame.config(bg=highlight_color, bd=0, relief='solid')
+            grid.set_fill(index, '#ffff90')
         else:
-            highlight_color = orig_color
-            bg_frame.config(bg=highlight_color, bd=0, relief='flat')
-        
-        for widget in text_widgets:
-            widget.config(bg=highlight_color)
+            grid.set_fill(index, orig_colors[index])
+
+    # Refresh the counts and highlights of the given cells in one pass
+    def refresh_cells(indices):
+        for index in indices:
+            grid.set_text(index, 'have', str(parts_data[index]['have']))
+            update_highlight(index)
+
+    # One entry moves to whichever "Have" count is being edited
+    editor = tk.Entry(canvas, width=5, font=text_font)
+    editor_item = canvas.create_window(
+        0, 0, window=editor, anchor="nw", state='hidden'
+    )
+    editing = None
+
+    def open_editor(index):
+        nonlocal editing
+        close_editor()
+        if loading or index not in visible:
+            return
+        editing = index
+        x, y = grid.text_xy(index, 'have')
+        canvas.coords(editor_item, x - 2, y - 2)
+        canvas.itemconfigure(editor_item, state='normal')
+        editor.delete(0, tk.END)
+        editor.insert(0, str(parts_data[index]['have']))
+        editor.select_range(0, tk.END)
+        editor.focus_set()
+
+    # Hide the entry, saving its value unless the edit was cancelled
+    def close_editor(save=True):
+        nonlocal editing
+        index = editing
+        if index is None:
+            return
+        editing = None
+        canvas.itemconfigure(editor_item, state='hidden')
+        if save:
+            update_and_save(editor.get(), index)
+
+    # Tab saves the current count and moves on to the next shown part
+    def edit_next(event):
+        index = editing
+        if index is not None and index in visible:
+            next_index = visible[(visible.index(index) + 1) % len(visible)]
+            close_editor()
+            open_editor(next_index)
+        return "break"
+
+    editor.bind("<Return>", lambda e: close_editor())
+    editor.bind("<FocusOut>", lambda e: close_editor())
+    editor.bind("<Escape>", lambda e: close_editor(save=False))
+    editor.bind("<Tab>", edit_next)
+
+    # Clicking a cell edits its count; Ctrl+click selects it
+    def on_click(event):
+        index = grid.index_at(event)
+        if index is None:
+            close_editor()
+            canvas.focus_set()
+        else:
+            open_editor(index)
+
+    def on_ctrl_click(event):
+        index = grid.index_at(event)
+        if index is not None:
+            toggle_selected(index)
+
+    canvas.bind("<Button-1>", on_click)
+    canvas.bind("<Control-Button-1>", on_ctrl_click)
+
+    # Apply a batch of changes as one transaction with a single save
+    def commit_changes(changes, record_undo=True):
+        if loading:
+            return
+        previous = apply_have_changes(parts_data, changes)
+        if not previous:
+            return
+        set_writer.schedule(set_title, parts_data, set_data_dir)
+        refresh_cells(previous)
+        if record_undo:
+            undo_stack.append(previous)
+
+        # Let other open windows patch their copies of these parts
+        state_bus.publish(
+            "have_changed", set_title=set_title, set_data_dir=set_data_dir, 
+            parts=have_change_events(parts_data, previous), source=load_window
+        )
+
+        # Completed parts drop out when only incomplete ones are shown
+        if incomplete_var.get():
+            arrange_cells()
     
     # Save any valid changes made
-    def update_and_save(entry, index, bg_frame, text_widgets, orig_color):
+    def update_and_save(text, index):
         try:
-            value = int(entry.get())
+            value = int(text)
         except ValueError:
             messagebox.showerror(
                 "Invalid Input", 
                 "Please enter a valid number.", 
                 parent=load_window
             )
-            delete_and_reinsert(entry, index)
             return
         
         if value < 0:
@@ -147,147 +409,302 @@ def show_set_grid(
                 "'Have' cannot be negative.", 
                 parent=load_window
             )
-            delete_and_reinsert(entry, index)
         elif value > parts_data[index]['need']:
             messagebox.showerror(
                 "Invalid Input", 
                 "'Have' cannot be greater than 'Need'.", 
                 parent=load_window
             )
-            delete_and_reinsert(entry, index)
         else:
-            parts_data[index]['have'] = value
-            save_set_data(set_title, parts_data, set_data_dir)
-            update_highlight(
-                parts_data[index], bg_frame, text_widgets, orig_color
+            commit_changes({index: value})
+
+    # Ctrl+click toggles whether a cell is selected for bulk edits
+    def toggle_selected(index):
+        if index in selected:
+            selected.discard(index)
+            grid.set_outline(index, None)
+        else:
+            selected.add(index)
+            grid.set_outline(index, '#309bff')
+
+    def clear_selection():
+        for index in list(selected):
+            toggle_selected(index)
+
+    # Mark every selected cell as complete
+    def complete_selected():
+        if not selected:
+            messagebox.showinfo(
+                "No Selection", 
+                "Ctrl+click parts to select them first.", 
+                parent=load_window
+            )
+            return
+        commit_changes({i: parts_data[i]['need'] for i in selected})
+        clear_selection()
+
+    # Mark every cell that passes the current filters as complete
+    def complete_shown():
+        if not visible:
+            return
+        if len(visible) == len(parts_data):
+            question = "Mark every part in this set as complete?"
+        else:
+            question = f"Mark the {len(visible)} parts shown as complete?"
+        if messagebox.askyesno("Complete Shown", question, parent=load_window):
+            commit_changes({i: parts_data[i]['need'] for i in visible})
+
+    # Set every "have" count in the set back to 0
+    def reset_set():
+        if messagebox.askyesno(
+            "Reset Set", 
+            "Set every 'Have' count in this set to 0?", 
+            parent=load_window
+        ):
+            commit_changes({i: 0 for i in range(len(parts_data))})
+
+    # Revert the most recent edit or batch of edits
+    def undo(event=None):
+        if undo_stack:
+            commit_changes(undo_stack.pop(), record_undo=False)
+
+    # Apply a pasted list of part counts
+    def paste_counts():
+        paste_window = tk.Toplevel(load_window)
+        paste_window.title("Paste Counts")
+        paste_window.configure(bg='#00173c')
+
+        tk.Label(
+            paste_window, 
+            text="One part per line: ID, color, count (+N adds N)", 
+            font=('Arial', 10), bg='#00173c', fg='white'
+        ).pack(padx=10, pady=5)
+
+        text_box = tk.Text(paste_window, width=50, height=15)
+        text_box.pack(padx=10, pady=5)
+        text_box.focus()
+
+        def apply_pasted():
+            changes, errors = parse_count_list(
+                text_box.get("1.0", tk.END), parts_data
             )
+            if errors:
+                messagebox.showerror(
+                    "Invalid Lines", "\n".join(errors), parent=paste_window
+                )
+                return
+            commit_changes(changes)
+            paste_window.destroy()
+
+        tk.Button(
+            paste_window, text="Apply", command=apply_pasted,
+            font=('Arial', 12, 'bold'), bg='#30ce30', fg='white',
+            padx=10, pady=2, cursor='hand2'
+        ).pack(pady=5)
+
+    # Create the bulk edit buttons
+    for text, command, color in (
+        ("Complete Selected", complete_selected, '#30ce30'),
+        ("Complete Shown", complete_shown, '#30ce30'),
+        ("Reset Set", reset_set, '#ff3030'),
+        ("Paste Counts", paste_counts, '#309bff'),
+        ("Undo", undo, '#ffce30'),
+    ):
+        tk.Button(
+            toolbar, text=text, command=command,
+            font=('Arial', 10, 'bold'), bg=color, fg='white',
+            padx=10, pady=2, cursor='hand2'
+        ).pack(side="left", padx=5)
+    load_window.bind("<Control-z>", undo)
     
     bg_color1 = '#f0f0f0'
     bg_color2 = '#bfbfbf'
 
-    # Create the grid layout. Each part takes up 3 rows and 6 columns
-    for i, part in enumerate(parts_data):
-        row = i // columns
-        col = i % columns
-        bg_color = bg_color1 if (row + col) % 2 == 0 else bg_color2
-        
-        # Base position for the current part
-        base_row = row * 3
-        base_col = col * 6
-
-        # Create background frame for the entire parts area
-        bg_frame = tk.Frame(content_frame, bg=bg_color, width=300, height=60)
-        bg_frame.grid(
-            row=base_row, column=base_col, 
-            rowspan=2, columnspan=6, 
-            padx=2, pady=2, sticky="nsew"
-        )
-        bg_frame.grid_propagate(False)
-        
-        # Load and display image
-        try:
-            with urllib.request.urlopen(part['image']) as response:
-                img_data = response.read()
-            
-            # Open with PIL and resize to 51x51
-            pil_image = Image.open(io.BytesIO(img_data))
-            pil_image = pil_image.resize((51, 51), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(pil_image)
-            
-            # Create label with image
-            img_label = tk.Label(
-                content_frame, image=photo, 
-                width=51, height=51
+    # Thumbnails are sliced from the shared atlas sheets. The window holds
+    # every image it draws until it is destroyed
+    thumbs = get_atlas(51, set_data_dir)
+    sticker_thumbs = get_atlas(100, set_data_dir)
+    held_thumbs: List[str] = []
+    held_stickers: List[str] = []
+
+    # Draw each part's cell: image on the left, then ID and color, then
+    # the need and have counts
+    def draw_cells(start):
+        count_x = layout['count_x']
+        thumbs.prefetch(part['image'] for part in parts_data[start:])
+        for i in range(start, len(parts_data)):
+            part = parts_data[i]
+            grid.add_cell(orig_colors[i])
+            photo = thumbs.acquire(part['image'])
+            if photo is not None:
+                held_thumbs.append(part['image'])
+            grid.add_image(i, 4, 4, photo, 51)
+            grid.add_text(i, 'id', 62, 8, f"ID: {part['id']}", id_font)
+            grid.add_text(
+                i, 'need', count_x, 8, f"Need: {part['need']}", text_font
             )
-            img_label.image = photo  # Keep a reference
-            img_label.grid(
-                row=base_row, column=base_col, rowspan=2, 
-                padx=4, pady=4, sticky="nw"
+            grid.add_text(
+                i, 'color', 62, 34, f"Color: {part['color']}", text_font
             )
-        
-        # Fallback to placeholder if image loading fails
-        except Exception as e:
-            img_frame = tk.Frame(
-                content_frame, width=51, height=51, 
-                bg='lightgray', relief='solid', bd=1
+            grid.add_text(i, 'have_label', count_x, 34, "Have:", text_font)
+            grid.add_text(
+                i, 'have', layout['have_x'], 34, str(part['have']), have_font
             )
-            img_frame.grid(
-                row=base_row, column=base_col, rowspan=2, 
-                padx=4, pady=4, sticky="nw"
+            if i in selected:
+                grid.set_outline(i, '#309bff')
+
+            # Set initial highlight state
+            update_highlight(i)
+
+    # Add newly read parts in file order, checkerboard colored
+    def add_new_cells():
+        start = len(orig_colors)
+        for i in range(start, len(parts_data)):
+            row, col = divmod(i, columns)
+            orig_colors.append(
+                bg_color1 if (row + col) % 2 == 0 else bg_color2
             )
-            img_frame.grid_propagate(False)
+        visible.extend(range(start, len(parts_data)))
+        draw_cells(start)
+        on_configure()
 
-            img_label = tk.Label(
-                img_frame, text="IMG", 
-                bg='lightgray', font=('Arial', 8)
-            )
-            img_label.place(relx=0.5, rely=0.5, anchor="center")
+    # Move existing cells into the current order without redrawing them
+    sort_keys: List[Dict[str, Any]] = []
+    visible: List[int] = []
 
-        # ID field
-        id_label = tk.Label(
-            content_frame, text=f"ID: {part['id']}", 
-            font=('Arial', 10, 'bold'), bg=bg_color
-        )
-        id_label.grid(
-            row=base_row, column=base_col+2, 
-            padx=4, pady=2, sticky="w"
+    def arrange_cells(event=None):
+        if loading:
+            return
+        close_editor()
+        groups = arrange_parts(
+            parts_data, sort_keys, sort_var.get(), group_var.get(), 
+            incomplete_var.get(), color_var.get(), category_var.get()
         )
-
-        # Need field
-        need_label = tk.Label(
-            content_frame, text=f"Need: {part['need']}", 
-            font=('Arial', 10), bg=bg_color
+        visible[:] = [i for group in groups for i in group]
+        for i in set(range(len(parts_data))) - set(visible):
+            grid.set_visible(i, False)
+
+        # Each group starts on a new row
+        position = 0
+        for group in groups:
+            if position % columns:
+                position += columns - position % columns
+            for i in group:
+                row, col = divmod(position, columns)
+                grid.move_cell(i, position)
+                grid.set_visible(i, True)
+                orig_colors[i] = (
+                    bg_color1 if (row + col) % 2 == 0 else bg_color2
+                )
+                position += 1
+        refresh_cells(visible)
+        on_configure()
+
+    sort_var = tk.StringVar(value=SORT_MODES[0])
+    group_var = tk.StringVar(value=GROUP_MODES[0])
+    color_var = tk.StringVar(value=ALL_FILTER)
+    category_var = tk.StringVar(value=ALL_FILTER)
+    incomplete_var = tk.BooleanVar(value=False)
+
+    # Color and category choices are filled in once every part is read
+    filter_boxes = {}
+    for label, variable, values in (
+        ("Sort:", sort_var, SORT_MODES),
+        ("Group:", group_var, GROUP_MODES),
+        ("Color:", color_var, [ALL_FILTER]),
+        ("Category:", category_var, [ALL_FILTER]),
+    ):
+        tk.Label(
+            view_bar, text=label, font=('Arial', 10), 
+            bg='#00173c', fg='white'
+        ).pack(side="left", padx=(5, 2))
+        combobox = ttk.Combobox(
+            view_bar, textvariable=variable, values=values, 
+            state='readonly', width=14
         )
-        need_label.grid(
-            row=base_row, column=base_col+4, 
-            padx=4, pady=2, sticky="w"
+        combobox.pack(side="left")
+        combobox.bind("<<ComboboxSelected>>", arrange_cells)
+        filter_boxes[label] = combobox
+
+    tk.Checkbutton(
+        view_bar, text="Incomplete Only", variable=incomplete_var, 
+        command=arrange_cells, font=('Arial', 10), 
+        bg='#00173c', fg='white', selectcolor='#00173c', 
+        activebackground='#00173c', activeforeground='white'
+    ).pack(side="left", padx=5)
+
+    def is_this_set(event):
+        return (
+            event['set_title'] == set_title and 
+            os.path.abspath(event['set_data_dir']) == 
+            os.path.abspath(set_data_dir)
         )
 
-        # Color field
-        color_label = tk.Label(
-            content_frame, text=f"Color: {part['color']}", 
-            font=('Arial', 10), bg=bg_color
-        )
-        color_label.grid(
-            row=base_row+1, column=base_col+2, 
-            padx=4, pady=2, sticky="w"
-        )
-        
-        # Have field
-        have_frame = tk.Frame(content_frame, bg=bg_color)
-        have_frame.grid(
-            row=base_row+1, column=base_col+4, 
-            padx=4, pady=2, sticky="w"
-        )
-        have_label = tk.Label(
-            have_frame, text="Have:", 
-            font=('Arial', 10), bg=bg_color
-        )
-        have_label.pack(side="left")
-
-        # Handle entries for Have field
-        entry = tk.Entry(have_frame, width=5, font=('Arial', 10))
-        entry.insert(0, str(part['have']))
-        entry.pack(side="left", padx=(4, 0))
-
-        # Create list of text widgets to get background color updates
-        text_widgets = [
-            id_label, need_label, color_label, 
-            have_frame, have_label
-        ]
-
-        entry.bind(
-            "<FocusOut>", lambda e, ent=entry, idx=i, bgf=bg_frame, 
-            widgets=text_widgets, orig_color=bg_color: 
-            update_and_save(ent, idx, bgf, widgets, orig_color)
-        )
+    # Edits made elsewhere while loading are applied again once every
+    # part has been read
+    pending_events: List[Dict[str, Any]] = []
+
+    # Patch only the affected cells when this set is edited elsewhere
+    def on_have_changed(**event):
+        if event.get('source') is load_window or not is_this_set(event):
+            return
+        if loading:
+            pending_events.append(event)
+            return
+        changed = []
+        for part in event['parts']:
+            index = part['index']
+            if (
+                0 <= index < len(parts_data) and 
+                parts_data[index]['id'] == part['id'] and 
+                parts_data[index]['color'] == part['color']
+            ):
+                parts_data[index]['have'] = part['have']
+                changed.append(index)
+        refresh_cells(changed)
+        if changed and incomplete_var.get():
+            arrange_cells()
+
+    # A rewritten parts list cannot be patched, so reopen the window
+    def on_set_replaced(**event):
+        if not is_this_set(event):
+            return
+        if window_pool.is_pooled(load_window):
+            window_pool.discard(pool_key)
+        else:
+            load_window.destroy()
+            show_set_grid(set_title, columns, set_data_dir)
+
+    unsubscribers = [
+        state_bus.subscribe("have_changed", on_have_changed),
+        state_bus.subscribe("set_replaced", on_set_replaced),
+    ]
+
+    def on_destroy(event):
+        if event.widget is load_window:
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+            if load_job is not None:
+                load_window.after_cancel(load_job)
+            stream.close()
+            grid.photos.clear()
+            thumbs.release(held_thumbs)
+            sticker_thumbs.release(held_stickers)
+    load_window.bind("<Destroy>", on_destroy)
 
-        # Set initial highlight state
-        update_highlight(part, bg_frame, text_widgets, bg_color)
+    # Back button
+    load_window_back_button = tk.Button(
+        content_frame, text="Back", command=close_window, 
+        font=('Arial', 12, 'bold'), bg='#ff3030', fg='white',
+        padx=20, pady=10, cursor='hand2'
+    )
+    load_window_back_button.grid(row=0, column=0, pady=20, columnspan=6)
 
     # Add stickers section if they exist
-    if stickers_data:
-        start_row = (len(parts_data)//columns + 1) * 3
+    def show_stickers():
+        if not stickers_data:
+            return
+        start_row = 0
 
         # Add separator
         separator = tk.Frame(content_frame, height=2, bg='white')
@@ -303,43 +720,81 @@ def show_set_grid(
         sticker_title.grid(row=start_row + 1, column=0, columnspan=6, pady=5)
         
         # Display sticker images
+        sticker_thumbs.prefetch(sticker["image"] for sticker in stickers_data)
         sticker_row = start_row + 2
         for i, sticker in enumerate(stickers_data):
-            try:
-                with urllib.request.urlopen(sticker["image"]) as response:
-                    img_data = response.read()
-                
-                pil_image = Image.open(io.BytesIO(img_data))
-                pil_image = pil_image.resize(
-                    (100, 100), Image.Resampling.LANCZOS
-                )
-                photo = ImageTk.PhotoImage(pil_image)
-                
-                sticker_label = tk.Label(content_frame, image=photo)
-                sticker_label.image = photo
-                sticker_label.grid(row=sticker_row, column=i, padx=5, pady=5)
-                
-                info_text = f"ID: {sticker['id']}\nQty: {sticker['quantity']}"
-                info_label = tk.Label(
-                    content_frame, text=info_text, font=('Arial', 8), 
-                    bg='#00173c', fg='white'
-                )
-                info_label.grid(row=sticker_row + 1, column=i, padx=5)
-                
-            except Exception as e:
-                print(f"Could not load sticker image: {e}")
+            photo = sticker_thumbs.acquire(sticker["image"])
+            if photo is None:
+                print(f"Could not load sticker image: {sticker['image']}")
+                continue
+            held_stickers.append(sticker["image"])
+
+            sticker_label = tk.Label(content_frame, image=photo)
+            sticker_label.image = photo
+            sticker_label.grid(row=sticker_row, column=i, padx=5, pady=5)
+            
+            info_text = f"ID: {sticker['id']}\nQty: {sticker['quantity']}"
+            info_label = tk.Label(
+                content_frame, text=info_text, font=('Arial', 8), 
+                bg='#00173c', fg='white'
+            )
+            info_label.grid(row=sticker_row + 1, column=i, padx=5)
         
-        back_button_row = sticker_row + 2
+        load_window_back_button.grid(row=sticker_row + 2)
+
+    # Everything that needs the whole set runs once the last part is read
+    def finish_loading():
+        nonlocal loading
+
+        # Later parts may need wider cells than the first ones did
+        new_layout = measure_layout()
+        if new_layout != layout:
+            layout.update(new_layout)
+            grid.clear()
+            thumbs.release(held_thumbs)
+            held_thumbs.clear()
+            grid.cell_width = layout['cell_width']
+            draw_cells(0)
+
+        sort_keys[:] = build_sort_keys(parts_data)
+        filter_boxes["Color:"]["values"] = (
+            [ALL_FILTER] + sorted({part['color'] for part in parts_data})
+        )
+        filter_boxes["Category:"]["values"] = (
+            [ALL_FILTER] + sorted({part['category'] for part in parts_data})
+        )
+        show_stickers()
+
+        loading = False
+        for event in pending_events:
+            on_have_changed(**event)
+        pending_events.clear()
+        arrange_cells()
+
+    # Read and draw the rest of the set a batch at a time so the window
+    # stays responsive
+    load_job = None
+
+    def load_more():
+        nonlocal load_job
+        load_job = None
+        try:
+            done = read_parts(len(parts_data) + LOAD_BATCH)
+        except ValueError as e:
+            messagebox.showerror(
+                "Error", f"Could not read set {set_title}: {e}", 
+                parent=load_window
+            )
+            load_window.destroy()
+            return
+        add_new_cells()
+        if done:
+            finish_loading()
+        else:
+            load_job = load_window.after(1, load_more)
+
+    add_new_cells()
+    if loading:
+        load_job = load_window.after(1, load_more)
     else:
-        back_button_row = (len(parts_data)//columns + 1) * 3
-    
-    # Back button
-    load_window_back_button = tk.Button(
-        content_frame, text="Back", command=load_window.destroy, 
-        font=('Arial', 12, 'bold'), bg='#ff3030', fg='white',
-        padx=20, pady=10, cursor='hand2'
-    )
-    load_window_back_button.grid(
-        row=back_button_row, column=0, 
-        pady=20, columnspan=6
-    )
\ No newline at end of file
+        finish_loading()
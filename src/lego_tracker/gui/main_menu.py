@@ -1,9 +1,14 @@
+import atexit
 import os
 import tkinter as tk
 from tkinter import simpledialog, messagebox, ttk
 from typing import Dict, List, Any
 
-from .create_win import create_new_set
+from ..archive import archive_completed_sets
+from ..state_bus import state_bus
+from .archive_win import show_archive_win
+from .create_win import create_new_set, describe_resync, resync_set
+from ..set_files import set_writer
 from .load_win import show_set_grid
 from .search_win import show_search_win
 from .win_helpers import configure_size
@@ -48,8 +53,30 @@ def main() -> None:
     root.title("Lego Set Organizer")
     root.geometry(configure_size(root))
 
+    # Write any queued set updates before the program exits
+    def exit_app():
+        set_writer.flush()
+        root.destroy()
+    root.protocol("WM_DELETE_WINDOW", exit_app)
+    atexit.register(set_writer.flush)
+
+    # Saves fail on the writer's thread, so warn from the main loop
+    def on_save_failed(set_title, error, **event):
+        root.after(0, lambda: messagebox.showerror(
+            "Save Failed",
+            f"Could not save set {set_title}: {error}\n"
+            "Your changes are kept and will be saved again shortly."
+        ))
+    state_bus.subscribe("save_failed", on_save_failed)
+
     styles = configure_styles(root)
 
+    # Sets completed elsewhere, e.g. by an import, are archived at startup
+    try:
+        archive_completed_sets(set_data_dir)
+    except OSError as e:
+        print(f"Could not archive completed sets: {e}")
+
     # Text at the top of the menu
     text_label = tk.Label(
         root, text="Select a Set:", 
@@ -62,6 +89,11 @@ def main() -> None:
     selected_set = ttk.Combobox(root, values=sets, font=styles['default_font'])
     selected_set.pack(pady=5)
 
+    # Keep the dropdown current whenever sets are added or removed
+    def refresh_sets(**event):
+        selected_set["values"] = list_sets(set_data_dir)
+    state_bus.subscribe("sets_changed", refresh_sets)
+
     # Load the data for a selected set ID
     def load_selected():
         if selected_set.get():
@@ -74,14 +106,29 @@ def main() -> None:
             try:
                 create_new_set(set_id, set_data_dir)
                 messagebox.showinfo("Success", f"Set {set_id} added.")
-                selected_set["values"] = list_sets(set_data_dir)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
+    # Update the selected set to its current Rebrickable inventory
+    def resync_selected():
+        if not selected_set.get():
+            return
+        try:
+            changes = resync_set(selected_set.get(), set_data_dir)
+            messagebox.showinfo(
+                "Re-sync Set", describe_resync(selected_set.get(), changes)
+            )
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
     # Search in all sets for a specific part ID
     def search():
         show_search_win(columns, set_data_dir)
 
+    # View or restore completed sets
+    def show_archive():
+        show_archive_win(set_data_dir)
+
     # Create buttons for the main menu
     load_button = tk.Button(
         root, text="Load Set", command=load_selected,
@@ -95,14 +142,26 @@ def main() -> None:
         padx=20, pady=5, cursor=styles['button_cursor']
     )
     create_button.pack(pady=5)
+    resync_button = tk.Button(
+        root, text="Re-sync Set", command=resync_selected,
+        font=styles['button_font'], bg='#9b30ff', fg='white',
+        padx=20, pady=5, cursor=styles['button_cursor']
+    )
+    resync_button.pack(pady=5)
     search_button = tk.Button(
         root, text="Search Parts", command=search,
         font=styles['button_font'], bg='#ffce30', fg='white',
         padx=20, pady=5, cursor=styles['button_cursor']
     )
     search_button.pack(pady=5)
+    archive_button = tk.Button(
+        root, text="Archived Sets", command=show_archive,
+        font=styles['button_font'], bg='#309bff', fg='white',
+        padx=20, pady=5, cursor=styles['button_cursor']
+    )
+    archive_button.pack(pady=5)
     exit_button = tk.Button(
-        root, text="Exit", command=root.destroy,
+        root, text="Exit", command=exit_app,
         font=styles['button_font'], bg='#ff3030', fg='white',
         padx=20, pady=5, cursor=styles['button_cursor']
     )
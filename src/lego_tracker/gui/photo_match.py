@@ -0,0 +1,151 @@
+import json
+import os
+from PIL import Image, ImageChops
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..set_files import write_json_atomic
+from .image_atlas import ATLAS_DIR_NAME, get_atlas
+
+# Thumbnail size hashed for every part image
+HASH_THUMB_SIZE = 60
+HASH_INDEX_NAME = 'hashes.json'
+
+
+# This computes a 64-bit difference hash: the image is cropped to its
+# subject, shrunk to 9x8 grayscale pixels, and each bit records whether
+# a pixel is brighter than its right-hand neighbour. Similar-looking
+# images get hashes that differ in only a few bits.
+def dhash(image: Image.Image) -> int:
+    # Transparent areas count as the white background of part renders
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    gray = image.convert('L')
+
+    # Crop away the plain border around the part, judged by the corner
+    corner = Image.new('L', gray.size, gray.getpixel((0, 0)))
+    mask = ImageChops.difference(gray, corner).point(
+        lambda value: 255 if value > 24 else 0
+    )
+    box = mask.getbbox()
+    if box:
+        gray = gray.crop(box)
+
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+# This stores hashes in a BK-tree. Each child sits under its Hamming
+# distance from the parent, so by the triangle inequality a search only
+# has to follow children within `radius` of the query's distance.
+class BKTree:
+    def __init__(self) -> None:
+        # Each node is [hash, urls with that hash, {distance: child}]
+        self.root: Optional[List[Any]] = None
+
+    def add(self, value: int, url: str) -> None:
+        if self.root is None:
+            self.root = [value, [url], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                if url not in node[1]:
+                    node[1].append(url)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, [url], {}]
+                return
+            node = node[2][distance]
+
+    # Every URL whose hash is within `radius` bits, closest first
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        matches: List[Tuple[int, str]] = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.extend((distance, url) for url in node[1])
+            for child_distance, child in node[2].items():
+                if abs(child_distance - distance) <= radius:
+                    stack.append(child)
+        return sorted(matches)
+
+
+# This keeps the hash of every part image in the collection, stored next
+# to the thumbnail atlases so each image is only hashed once.
+class PhotoIndex:
+    def __init__(self, set_data_dir: str = 'set_data') -> None:
+        self.set_data_dir = set_data_dir
+        self.index_path = os.path.join(
+            set_data_dir, ATLAS_DIR_NAME, HASH_INDEX_NAME
+        )
+        self.hashes: Dict[str, int] = {}
+        self.tree = BKTree()
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    stored = json.load(f)
+                self.hashes = {url: int(h, 16) for url, h in stored.items()}
+            except (json.JSONDecodeError, ValueError, AttributeError):
+                self.hashes = {}
+        for url, value in self.hashes.items():
+            self.tree.add(value, url)
+
+    # Hash any images not seen before, downloading missing thumbnails
+    def update(self, urls: Iterable[Optional[str]]) -> None:
+        missing = {url for url in urls if url and url not in self.hashes}
+        if not missing:
+            return
+
+        atlas = get_atlas(HASH_THUMB_SIZE, self.set_data_dir)
+        atlas.prefetch(missing)
+        added = False
+        for url in missing:
+            image = atlas.get_image(url)
+            if image is not None:
+                self.hashes[url] = dhash(image)
+                self.tree.add(self.hashes[url], url)
+                added = True
+        if not added:
+            return
+
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        write_json_atomic(
+            self.index_path,
+            {url: f"{value:016x}" for url, value in self.hashes.items()},
+            None
+        )
+
+    # Image URLs that look like the given image, closest first
+    def match(
+        self,
+        image: Image.Image,
+        radius: int
+    ) -> List[Tuple[int, str]]:
+
+        return self.tree.search(dhash(image), radius)
+
+
+# One index per data directory is shared by every window
+_photo_indexes: Dict[str, PhotoIndex] = {}
+
+def get_photo_index(set_data_dir: str = 'set_data') -> PhotoIndex:
+    key = os.path.abspath(set_data_dir)
+    if key not in _photo_indexes:
+        _photo_indexes[key] = PhotoIndex(set_data_dir)
+    return _photo_indexes[key]
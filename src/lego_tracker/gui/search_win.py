@@ -1,13 +1,29 @@
-import io
-import json
 import os
-import re
 import tkinter as tk
-import urllib.request
-from PIL import Image, ImageTk
-from tkinter import messagebox, ttk
+from PIL import Image
+from tkinter import filedialog, messagebox, ttk
 from typing import List, Dict, Any
 
+from ..allocation import (
+    allocate_parts,
+    apply_allocation,
+    describe_allocation,
+    get_need_index,
+    parse_found_parts,
+)
+from ..equivalence import get_part_classes
+from ..search import (
+    NEAREST_COLORS,
+    find_needed_parts,
+    search_near_color,
+    search_sets,
+    split_search_terms,
+)
+from ..set_files import set_writer
+from ..state_bus import state_bus
+from .canvas_grid import CanvasGrid
+from .image_atlas import get_atlas
+from .photo_match import get_photo_index
 from .win_helpers import (
     configure_size, 
     on_mousewheel, 
@@ -15,81 +31,41 @@ from .win_helpers import (
 )
 
 
-# This returns a list of set IDs that need a specific part ID.
-def search_sets(
-        input_query: str, 
-        set_data_dir: str = 'set_data'
+# Most parts shown for a photo, and the largest hash difference (out of
+# 64 bits) still counted as a match
+PHOTO_MATCHES = 20
+PHOTO_MATCH_RADIUS = 20
+
+
+# This returns the needed parts whose images look most like a photo or
+# image file, closest first.
+def search_by_photo(
+        image_path: str, 
+        set_data_dir: str = 'set_data', 
+        limit: int = PHOTO_MATCHES
 ) -> List[Dict[str, Any]]:
     
-    # Sanitize and split the search query
-    query = "".join(
-        c for c in input_query
-        if c.isalnum() or c in (' ', '-', "'")
-    )
-    search_terms: List[str] = [
-        term.strip().lower() for term in query.split() if term.strip()
-    ]
+    needed = find_needed_parts([], set_data_dir)
+    photo_index = get_photo_index(set_data_dir)
+    photo_index.update(result["image_url"] for result in needed)
 
-    # Return empty list if there are no search terms
-    if not search_terms:
-        return []
-    
-    # Collect all unique parts that are still needed from each set
-    needed_parts: Dict[tuple, Dict[str, Any]] = {}
-    
-    for set_file in os.listdir(set_data_dir):
-        if not set_file.endswith('.txt'):
-            continue
-            
-        file_path = os.path.join(set_data_dir, set_file)
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-
-                # Skip completed sets
-                if data.get("set_info", {}).get("completed", False):
-                    continue
-
-                parts = data["parts"]
-                set_name = set_file[:-4]
-                
-                for part in parts:
-                    # Skip completed parts
-                    if part["have"] >= part["need"]:
-                        continue
-
-                    part_search_words = part.get("search_words", [])
-
-                    all_terms_match = True
-                    for term in search_terms:
-                        if term not in part_search_words:
-                            all_terms_match = False
-                            break
-
-                    if all_terms_match:
-                        part_key = (part["id"], part["color"])
-
-                        # Add info from each needed part
-                        if part_key not in needed_parts:
-                            needed_parts[part_key] = {
-                                "part_id": part["id"],
-                                "name": part["name"],
-                                "category": part["category"],
-                                "color": part["color"],
-                                "image_url": part["image"],
-                                "sets_needing": [],
-                                "total_needed": 0
-                            }
-                        
-                        needed_parts[part_key]["sets_needing"].append(set_name)
-                        needed_parts[part_key]["total_needed"] += (
-                            part["need"] - part["have"]
-                        )
-                        
-        except (json.JSONDecodeError, KeyError, FileNotFoundError):
-            continue
-    
-    return list(needed_parts.values())
+    with Image.open(image_path) as image:
+        image.load()
+        matches = photo_index.match(image, PHOTO_MATCH_RADIUS)
+
+    # Several parts may share an image, such as one mold in many colors
+    by_url: Dict[str, List[Dict[str, Any]]] = {}
+    for result in needed:
+        by_url.setdefault(result["image_url"], []).append(result)
+
+    results: List[Dict[str, Any]] = []
+    for distance, url in matches:
+        for result in by_url.get(url, []):
+            result["photo_distance"] = distance
+            results.append(result)
+        if len(results) >= limit:
+            break
+    return results[:limit]
 
 
 # This shows the search interface with a grid of results
@@ -110,6 +86,40 @@ def show_search_win(columns: int = 5, set_data_dir: str = 'set_data') -> None:
     
     search_entry = tk.Entry(search_frame, font=('Arial', 12), width=30)
     search_entry.pack(side="left", padx=5)
+
+    # Search around an approximate color instead of an exact color name
+    color_frame = tk.Frame(search_window, bg='#00173c')
+    color_frame.pack()
+
+    tk.Label(
+        color_frame, text="Near Color:", font=('Arial', 12), 
+        bg='#00173c', fg='white'
+    ).pack(side="left", padx=5)
+
+    color_entry = tk.Entry(color_frame, font=('Arial', 12), width=16)
+    color_entry.pack(side="left", padx=5)
+
+    tk.Label(
+        color_frame, text="Colors:", font=('Arial', 12), 
+        bg='#00173c', fg='white'
+    ).pack(side="left", padx=5)
+
+    color_count = tk.Spinbox(
+        color_frame, from_=1, to=10, width=3, font=('Arial', 12)
+    )
+    color_count.delete(0, tk.END)
+    color_count.insert(0, str(NEAREST_COLORS))
+    color_count.pack(side="left", padx=5)
+
+    # Count alternate, mold and print variants as the same part
+    equivalents_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(
+        color_frame, text="Match Equivalent Parts", 
+        variable=equivalents_var, font=('Arial', 10), 
+        command=lambda: search_entry.get().strip() and perform_search(), 
+        bg='#00173c', fg='white', selectcolor='#00173c', 
+        activebackground='#00173c', activeforeground='white'
+    ).pack(side="left", padx=5)
     
     # Results label
     results_label = tk.Label(
@@ -140,9 +150,9 @@ def show_search_win(columns: int = 5, set_data_dir: str = 'set_data') -> None:
     v_scrollbar.config(command=canvas.yview)
     h_scrollbar.config(command=canvas.xview)
 
-    # Frame to hold the grid content
+    # Frame below the results for messages and the Back button
     content_frame = tk.Frame(canvas, bg='#00173c')
-    canvas.create_window((0, 0), window=content_frame, anchor="nw")
+    footer = canvas.create_window((0, 0), window=content_frame, anchor="nw")
 
     # Mouse wheel scrolling
     canvas.bind(
@@ -158,9 +168,19 @@ def show_search_win(columns: int = 5, set_data_dir: str = 'set_data') -> None:
         "<Shift-MouseWheel>", lambda event: on_shift_mousewheel(canvas, event)
     )
 
-    # Set boundaries for the scrollbars
-    def on_configure(event):
-        canvas.configure(scrollregion=canvas.bbox("all"))
+    # Every result is drawn as a few items on the canvas itself
+    grid = CanvasGrid(canvas, columns, 300, 90)
+
+    # Set boundaries for the scrollbars, keeping the footer below the parts
+    def on_configure(event=None):
+        top = grid.bottom() + 10 if grid.cells else 0
+        canvas.coords(footer, 0, top)
+        width = max(
+            grid.position_xy(columns - 1)[0] + grid.cell_width + grid.gap, 
+            content_frame.winfo_reqwidth()
+        )
+        height = top + content_frame.winfo_reqheight()
+        canvas.configure(scrollregion=(0, 0, width, height))
     content_frame.bind("<Configure>", on_configure)
 
     # Display which sets need a specific part
@@ -171,15 +191,47 @@ def show_search_win(columns: int = 5, set_data_dir: str = 'set_data') -> None:
         for i, set_name in enumerate(part_info['sets_needing'], 1):
             sets_text += f"{i}. {set_name}\n"
         sets_text += f"\nTotal needed: {part_info['total_needed']}"
+        if len(part_info.get('equivalent_ids', [])) > 1:
+            sets_text += (
+                "\nIncluding equivalent parts: " + 
+                ", ".join(part_info['equivalent_ids'])
+            )
         
         messagebox.showinfo(
             "Sets Needing This Part", sets_text, parent=search_window
         )
 
+    # Info and cell index of each displayed result, keyed by (ID, color)
+    result_cells: Dict[tuple, Dict[str, Any]] = {}
+    cell_parts: List[Dict[str, Any]] = []
+
+    # Make every cell clickable
+    def on_part_click(event):
+        index = grid.index_at(event)
+        if index is not None:
+            show_sets_needing_part(cell_parts[index])
+
+    def on_motion(event):
+        clickable = grid.index_at(event) is not None
+        canvas.configure(cursor="hand2" if clickable else "")
+
+    canvas.bind("<Button-1>", on_part_click)
+    canvas.bind("<Motion>", on_motion)
+
+    # Thumbnails drawn in the grid are held until it is cleared
+    thumbs = get_atlas(60, set_data_dir)
+    held_thumbs: List[str] = []
+
     # Clear the grid of all cells
     def clear_grid():
+        result_cells.clear()
+        cell_parts.clear()
+        grid.clear()
+        thumbs.release(held_thumbs)
+        held_thumbs.clear()
         for widget in content_frame.winfo_children():
             widget.destroy()
+        on_configure()
 
     # Create the search results grid
     def create_search_grid(results):
@@ -198,166 +250,245 @@ def show_search_win(columns: int = 5, set_data_dir: str = 'set_data') -> None:
         bg_color1 = '#f0f0f0'
         bg_color2 = '#bfbfbf'
 
-        # Create the grid layout
+        # Slice every thumbnail from the shared atlas sheets
+        thumbs.prefetch(part_info['image_url'] for part_info in results)
+
+        # Draw each result: image on the left, then ID, name, color and
+        # category
         for i, part_info in enumerate(results):
             row = i // columns
             col = i % columns
             bg_color = bg_color1 if (row + col) % 2 == 0 else bg_color2
             
-            # Base position for the current part
-            base_row = row * 3
-            base_col = col * 6
-
-            # Create background frame for the entire parts area
-            bg_frame = tk.Frame(
-                content_frame, bg=bg_color, width=300, height=80
-            )
-            bg_frame.grid(
-                row=base_row, column=base_col, 
-                rowspan=3, columnspan=6, 
-                padx=2, pady=2, sticky="nsew"
-            )
-            bg_frame.grid_propagate(False)
-            
-            # Make the entire frame clickable
-            def on_part_click(event, part=part_info):
-                show_sets_needing_part(part)
-            
-            bg_frame.bind("<Button-1>", on_part_click)
-            bg_frame.configure(cursor="hand2")  # indicate its clickable
-
-            # Load and display image
-            try:
-                with urllib.request.urlopen(part_info['image_url']) as response:
-                    img_data = response.read()
-                
-                pil_image = Image.open(io.BytesIO(img_data))
-                pil_image = (
-                    pil_image.resize((60, 60), Image.Resampling.LANCZOS)
-                )
-                photo = ImageTk.PhotoImage(pil_image)
-                
-                # Create label with image
-                img_label = tk.Label(
-                    content_frame, image=photo, 
-                    width=60, height=60
-                )
-                img_label.image = photo  # Keep a reference
-                img_label.grid(
-                    row=base_row, column=base_col, rowspan=3, 
-                    padx=4, pady=4, sticky="nw"
-                )
-                img_label.bind("<Button-1>", on_part_click)
-                img_label.configure(cursor="hand2")
-            
-            # Fallback to placeholder if image loading fails
-            except Exception as e:
-                img_frame = tk.Frame(
-                    content_frame, width=60, height=60, 
-                    bg='lightgray', relief='solid', bd=1
-                )
-                img_frame.grid(
-                    row=base_row, column=base_col, rowspan=3, 
-                    padx=4, pady=4, sticky="nw"
-                )
-                img_frame.grid_propagate(False)
-                img_frame.bind("<Button-1>", on_part_click)
-                img_frame.configure(cursor="hand2")
-                
-                img_label = tk.Label(
-                    img_frame, text="IMG", 
-                    bg='lightgray', font=('Arial', 8)
-                )
-                img_label.place(relx=0.5, rely=0.5, anchor="center")
-                img_label.bind("<Button-1>", on_part_click)
-                img_label.configure(cursor="hand2")
-
-            # Part information labels
-            info_labels = []
-            
-            # ID and Name
-            id_name_label = tk.Label(
-                content_frame, 
-                text=f"ID: {part_info['part_id']}", 
-                font=('Arial', 9, 'bold'), 
-                bg=bg_color
+            index = grid.add_cell(bg_color)
+            photo = thumbs.acquire(part_info['image_url'])
+            if photo is not None:
+                held_thumbs.append(part_info['image_url'])
+            grid.add_image(index, 4, 4, photo, 60)
+            grid.add_text(
+                index, 'id', 72, 4, f"ID: {part_info['part_id']}", 
+                ('Arial', 9, 'bold')
             )
-            id_name_label.grid(
-                row=base_row, column=base_col+2, columnspan=4, 
-                padx=4, pady=1, sticky="w"
-            )
-            info_labels.append(id_name_label)
-            
-            name_label = tk.Label(
-                content_frame, 
-                text=part_info['name'], 
-                font=('Arial', 8), 
-                bg=bg_color, 
-                wraplength=180
+            grid.add_text(
+                index, 'name', 72, 20, part_info['name'], 
+                ('Arial', 8), width=220
             )
-            name_label.grid(
-                row=base_row+1, column=base_col+2, columnspan=4, 
-                padx=4, pady=1, sticky="w"
+            grid.add_text(
+                index, 'color', 72, 62, f"Color: {part_info['color']}", 
+                ('Arial', 8), width=110
             )
-            info_labels.append(name_label)
-
-            # Color and Category
-            color_label = tk.Label(
-                content_frame, 
-                text=f"Color: {part_info['color']}", 
-                font=('Arial', 8), 
-                bg=bg_color
-            )
-            color_label.grid(
-                row=base_row+2, column=base_col+2, columnspan=2, 
-                padx=4, pady=1, sticky="w"
-            )
-            info_labels.append(color_label)
-            
-            category_label = tk.Label(
-                content_frame, 
-                text=f"Category: {part_info['category']}", 
-                font=('Arial', 8), 
-                bg=bg_color, 
-                wraplength=100
+            grid.add_text(
+                index, 'category', 186, 62, 
+                f"Category: {part_info['category']}", 
+                ('Arial', 8), width=110
             )
-            category_label.grid(
-                row=base_row+2, column=base_col+4, columnspan=2, 
-                padx=4, pady=1, sticky="w"
-            )
-            info_labels.append(category_label)
 
-            # Make all labels clickable
-            for label in info_labels:
-                label.bind("<Button-1>", on_part_click)
-                label.configure(cursor="hand2")
+            # Merged results are found under each equivalent part's ID
+            cell_parts.append(part_info)
+            cell = {'info': part_info, 'index': index}
+            for part_id in part_info.get(
+                'equivalent_ids', [part_info['part_id']]
+            ):
+                result_cells[(part_id, part_info['color'])] = cell
 
         # Add back button
-        back_button_row = (len(results)//columns + 1) * 3
         back_button = tk.Button(
             content_frame, text="Back", command=search_window.destroy, 
             font=('Arial', 12, 'bold'), bg='#ff3030', fg='white',
             padx=20, pady=10, cursor='hand2'
         )
-        back_button.grid(row=back_button_row, column=0, pady=20, columnspan=6)
+        back_button.pack(pady=20)
+        on_configure()
+
+    # The last kind of search run, repeated when results go out of date
+    last_search = None
 
     # Search sets and construct grid accordingly
     def perform_search():
+        nonlocal last_search
+        last_search = perform_search
         query = search_entry.get().strip()
         if not query:
             results_label.config(text="Enter search terms above")
             clear_grid()
             return
         
-        results = search_sets(query, set_data_dir)
+        # Load the equivalent parts first, so a failure to fetch them is
+        # told apart from one in the search itself
+        if equivalents_var.get():
+            try:
+                get_part_classes(set_data_dir)
+            except Exception as e:
+                messagebox.showerror(
+                    "Error", f"Could not load equivalent parts: {e}", 
+                    parent=search_window
+                )
+                return
+
+        try:
+            results = search_sets(
+                query, set_data_dir, equivalents_var.get()
+            )
+        except Exception as e:
+            messagebox.showerror(
+                "Error", f"Could not search sets: {e}", parent=search_window
+            )
+            return
         
         if results:
             results_label.config(text=f"Found {len(results)} matching parts:")
-            create_search_grid(results)
+
+            # A repeated search keeps the cells already drawn
+            if results != cell_parts:
+                create_search_grid(results)
         else:
             results_label.config(text="No matching parts found")
             clear_grid()
 
+    # Search needed parts in the colors closest to the one entered,
+    # still matching any search terms
+    def perform_color_search():
+        nonlocal last_search
+        last_search = perform_color_search
+        try:
+            results, nearest = search_near_color(
+                search_entry.get(), color_entry.get(), 
+                int(color_count.get()), set_data_dir
+            )
+        except ValueError as e:
+            messagebox.showerror("Invalid Color", str(e), parent=search_window)
+            return
+        except Exception as e:
+            messagebox.showerror(
+                "Error", f"Could not load the color table: {e}", 
+                parent=search_window
+            )
+            return
+
+        color_names = ", ".join(name for name, _ in nearest)
+        if results:
+            results_label.config(
+                text=f"Found {len(results)} needed parts in {color_names}:"
+            )
+            if results != cell_parts:
+                create_search_grid(results)
+        else:
+            results_label.config(text=f"No needed parts in {color_names}")
+            clear_grid()
+
+    # Show the needed parts that look most like a chosen photo
+    def perform_photo_search():
+        nonlocal last_search
+        image_path = filedialog.askopenfilename(
+            parent=search_window, title="Choose a Photo of the Part", 
+            filetypes=[
+                ("Images", "*.png *.jpg *.jpeg *.gif *.bmp *.webp"), 
+                ("All Files", "*.*")
+            ]
+        )
+        if not image_path:
+            return
+
+        def repeat_photo_search():
+            try:
+                results = search_by_photo(image_path, set_data_dir)
+            except OSError as e:
+                messagebox.showerror(
+                    "Error", f"Could not open the image: {e}", 
+                    parent=search_window
+                )
+                return
+            file_name = os.path.basename(image_path)
+            if results:
+                results_label.config(
+                    text=f"Found {len(results)} needed parts that look "
+                         f"like {file_name}:"
+                )
+                if results != cell_parts:
+                    create_search_grid(results)
+            else:
+                results_label.config(
+                    text=f"No needed parts look like {file_name}"
+                )
+                clear_grid()
+
+        last_search = repeat_photo_search
+        repeat_photo_search()
+
+    # Patch displayed results when parts are edited in another window
+    def on_have_changed(**event):
+        if (
+            os.path.abspath(event['set_data_dir']) != 
+            os.path.abspath(set_data_dir)
+        ):
+            return
+
+        search_terms = split_search_terms(search_entry.get())
+        set_name = event['set_title']
+        needs_search = False
+        patched = False
+        for part in event['parts']:
+            old_remaining = max(0, part['need'] - part['old_have'])
+            new_remaining = max(0, part['need'] - part['have'])
+            if old_remaining == new_remaining:
+                continue
+
+            cell = result_cells.get((part['id'], part['color']))
+            if cell is None:
+                # A part that is needed again may now match the search
+                if new_remaining and search_terms and all(
+                    term in part['search_words'] for term in search_terms
+                ):
+                    needs_search = True
+                continue
+
+            # Merged results are simpler to search again than to patch
+            info = cell['info']
+            if len(info.get('equivalent_ids', [])) > 1:
+                needs_search = True
+                continue
+
+            info['total_needed'] += new_remaining - old_remaining
+            if not new_remaining and set_name in info['sets_needing']:
+                info['sets_needing'].remove(set_name)
+            elif not old_remaining:
+                info['sets_needing'].append(set_name)
+            patched = True
+
+            # Parts that are no longer needed leave the grid
+            if info['total_needed'] <= 0:
+                grid.set_visible(cell['index'], False)
+                del result_cells[(part['id'], part['color'])]
+
+        if needs_search and last_search is not None:
+            last_search()
+        elif patched and result_cells:
+            shown = len({cell['index'] for cell in result_cells.values()})
+            results_label.config(text=f"Found {shown} matching parts:")
+        elif patched:
+            results_label.config(text="No matching parts found")
+
+    # Search again when a re-sync rewrites a set or sets come and go
+    def on_sets_changed(**event):
+        if (
+            os.path.abspath(event['set_data_dir']) == 
+            os.path.abspath(set_data_dir) and last_search is not None
+        ):
+            last_search()
+
+    unsubscribers = [
+        state_bus.subscribe("have_changed", on_have_changed),
+        state_bus.subscribe("set_replaced", on_sets_changed),
+        state_bus.subscribe("sets_changed", on_sets_changed),
+    ]
+
+    def on_destroy(event):
+        if event.widget is search_window:
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+            thumbs.release(held_thumbs)
+    search_window.bind("<Destroy>", on_destroy)
+
     # Search button
     search_button = tk.Button(
         search_frame, text="Search", command=perform_search,
@@ -366,6 +497,96 @@ def show_search_win(columns: int = 5, set_data_dir: str = 'set_data') -> None:
     )
     search_button.pack(side="left", padx=5)
 
+    # Suggest which sets a handful of found parts should go into
+    def show_allocate_win():
+        allocate_window = tk.Toplevel(search_window)
+        allocate_window.title("Allocate Found Parts")
+        allocate_window.configure(bg='#00173c')
+
+        tk.Label(
+            allocate_window, 
+            text="One found part per line: ID, color, count", 
+            font=('Arial', 10), bg='#00173c', fg='white'
+        ).pack(padx=10, pady=5)
+
+        parts_box = tk.Text(allocate_window, width=50, height=8)
+        parts_box.pack(padx=10, pady=5)
+        parts_box.focus()
+
+        result_box = tk.Text(
+            allocate_window, width=50, height=12, state='disabled'
+        )
+        result_box.pack(padx=10, pady=5)
+
+        current = {}
+
+        def run_allocation():
+            found, labels, errors = parse_found_parts(
+                parts_box.get("1.0", tk.END)
+            )
+            if errors:
+                messagebox.showerror(
+                    "Invalid Lines", "\n".join(errors), parent=allocate_window
+                )
+                return
+            set_writer.flush()
+            index = get_need_index(set_data_dir)
+            current['allocation'] = allocate_parts(found, index, labels)
+
+            result_box.config(state='normal')
+            result_box.delete("1.0", tk.END)
+            result_box.insert(
+                "1.0", describe_allocation(current['allocation'])
+            )
+            result_box.config(state='disabled')
+
+        # Record the suggested allocation in the set files
+        def save_allocation():
+            if 'allocation' not in current:
+                return
+            apply_allocation(current.pop('allocation'), set_data_dir)
+            allocate_window.destroy()
+            if last_search is not None:
+                last_search()
+
+        button_frame = tk.Frame(allocate_window, bg='#00173c')
+        button_frame.pack(pady=5)
+        tk.Button(
+            button_frame, text="Allocate", command=run_allocation,
+            font=('Arial', 12, 'bold'), bg='#30ce30', fg='white',
+            padx=10, pady=2, cursor='hand2'
+        ).pack(side="left", padx=5)
+        tk.Button(
+            button_frame, text="Apply", command=save_allocation,
+            font=('Arial', 12, 'bold'), bg='#309bff', fg='white',
+            padx=10, pady=2, cursor='hand2'
+        ).pack(side="left", padx=5)
+
+    # Nearest colors button
+    color_button = tk.Button(
+        color_frame, text="Nearest Colors", command=perform_color_search,
+        font=('Arial', 12, 'bold'), bg='#9b30ff', fg='white',
+        padx=10, pady=2, cursor='hand2'
+    )
+    color_button.pack(side="left", padx=5)
+    color_entry.bind("<Return>", lambda e: perform_color_search())
+
+    # Find by photo button
+    photo_button = tk.Button(
+        search_frame, text="Find by Photo", command=perform_photo_search,
+        font=('Arial', 12, 'bold'), bg='#ffce30', fg='white',
+        padx=10, pady=2, cursor='hand2'
+    )
+    photo_button.pack(side="left", padx=5)
+
+    # Allocate button
+    allocate_button = tk.Button(
+        search_frame, text="Allocate", command=show_allocate_win,
+        font=('Arial', 12, 'bold'), bg='#309bff', fg='white',
+        padx=10, pady=2, cursor='hand2'
+    )
+    allocate_button.pack(side="left", padx=5)
+
     # Bind Enter key to search
     search_entry.bind("<Return>", lambda e: perform_search())
     
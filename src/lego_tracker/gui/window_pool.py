@@ -0,0 +1,68 @@
+import os
+import tkinter as tk
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+PoolKey = Tuple[str, str]
+
+
+# This identifies the current version of a file without reading it.
+def file_stamp(file_path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# This keeps the most recently closed windows hidden instead of destroyed,
+# so reopening one only has to show it again. The least recently used
+# window is destroyed once the pool is full, which releases its images.
+class WindowPool:
+    def __init__(self, capacity: int = 4) -> None:
+        self.capacity = capacity
+        self.entries: "OrderedDict[PoolKey, Dict[str, Any]]" = OrderedDict()
+
+    # Hide a window, remembering the file version it shows
+    def put(self, key: PoolKey, window: tk.Toplevel, file_path: str) -> None:
+        if key in self.entries:
+            self.discard(key)
+        window.withdraw()
+        self.entries[key] = {
+            'window': window,
+            'file_path': file_path,
+            'stamp': file_stamp(file_path)
+        }
+        while len(self.entries) > self.capacity:
+            self.discard(next(iter(self.entries)))
+
+    # Show a hidden window again if its file has not changed since
+    def take(self, key: PoolKey) -> Optional[tk.Toplevel]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if file_stamp(entry['file_path']) != entry['stamp']:
+            self.discard(key)
+            return None
+
+        del self.entries[key]
+        window = entry['window']
+        window.deiconify()
+        window.lift()
+        return window
+
+    def is_pooled(self, window: tk.Toplevel) -> bool:
+        return any(
+            entry['window'] is window for entry in self.entries.values()
+        )
+
+    # Destroy a hidden window, which gives back the images it holds
+    def discard(self, key: PoolKey) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        entry['window'].destroy()
+
+    def clear(self) -> None:
+        for key in list(self.entries):
+            self.discard(key)
@@ -0,0 +1,208 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .set_files import split_into_search_words, write_json_atomic
+
+# Expected types of the stored fields, as written by create_new_set
+SET_INFO_FIELDS = {"set_id": str, "name": str}
+PART_FIELDS = {
+    "id": str, "name": str, "category": str, "color": str,
+    "need": int, "have": int
+}
+STICKER_FIELDS = {
+    "id": str, "name": str, "category": str, "color": str, "quantity": int
+}
+
+
+# This lists every problem that stops a set file from being used.
+def validate_set_data(data: Any) -> List[str]:
+    if not isinstance(data, dict):
+        return ["file is not a JSON object"]
+
+    errors: List[str] = []
+    for section, expected in (
+        ("set_info", dict), ("parts", list), ("stickers", list)
+    ):
+        if not isinstance(data.get(section), expected):
+            errors.append(
+                f"'{section}' is missing or not a {expected.__name__}"
+            )
+    if errors:
+        return errors
+
+    for field, field_type in SET_INFO_FIELDS.items():
+        if not isinstance(data["set_info"].get(field), field_type):
+            errors.append(f"set_info has a missing or invalid '{field}'")
+
+    for section, fields in (
+        ("parts", PART_FIELDS), ("stickers", STICKER_FIELDS)
+    ):
+        for i, item in enumerate(data[section]):
+            if not isinstance(item, dict):
+                errors.append(f"{section}[{i}] is not an object")
+                continue
+            for field, field_type in fields.items():
+                value = item.get(field)
+                # bool is a subclass of int, so rule it out explicitly
+                if (
+                    not isinstance(value, field_type)
+                    or isinstance(value, bool)
+                ):
+                    errors.append(
+                        f"{section}[{i}] has a missing or invalid '{field}'"
+                    )
+    return errors
+
+
+# This recomputes every derived field and returns what was changed.
+def recompute_derived_fields(data: Dict[str, Any]) -> List[str]:
+    repairs: List[str] = []
+
+    for section in ("parts", "stickers"):
+        for item in data[section]:
+            search_words = split_into_search_words(
+                f"{item['id']} {item['name']} "
+                f"{item['category']} {item['color']}"
+            )
+            if item.get("search_words") != search_words:
+                item["search_words"] = search_words
+                repairs.append(f"rebuilt search words for {item['id']}")
+
+    for part in data["parts"]:
+        clamped = max(0, min(part["have"], part["need"]))
+        if part["have"] != clamped:
+            repairs.append(
+                f"clamped 'have' of {part['id']} from {part['have']} "
+                f"to {clamped}"
+            )
+            part["have"] = clamped
+
+    set_info = data["set_info"]
+    completed = all(part["have"] >= part["need"] for part in data["parts"])
+    parts_found = sum(part["have"] for part in data["parts"])
+    if set_info.get("completed") != completed:
+        set_info["completed"] = completed
+        repairs.append(f"set 'completed' to {completed}")
+    if set_info.get("parts_found") != parts_found:
+        set_info["parts_found"] = parts_found
+        repairs.append(f"set 'parts_found' to {parts_found}")
+    if not isinstance(set_info.get("notes"), str):
+        set_info["notes"] = ""
+        repairs.append("added empty 'notes'")
+
+    # 'restored' keeps a set out of the archive until it is next saved,
+    # and is left alone unless it is not a flag
+    if "restored" in set_info and not isinstance(set_info["restored"], bool):
+        del set_info["restored"]
+        repairs.append("removed invalid 'restored'")
+
+    return repairs
+
+
+# This checks one set file, rewriting it if asked to. Runs in a worker.
+def check_set_file(file_path: str, fix: bool = False) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "set": os.path.basename(file_path)[:-4],
+        "errors": [],
+        "repairs": [],
+        "fixed": False
+    }
+    try:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        result["errors"].append(f"invalid JSON: {e}")
+        return result
+
+    result["errors"] = validate_set_data(data)
+    if result["errors"]:
+        return result
+
+    result["repairs"] = recompute_derived_fields(data)
+    if fix and result["repairs"]:
+        write_json_atomic(file_path, data)
+        result["fixed"] = True
+    return result
+
+
+def _check_set_file_fixing(file_path: str) -> Dict[str, Any]:
+    return check_set_file(file_path, fix=True)
+
+
+# This checks every set file in parallel across a pool of processes.
+def check_collection(
+    set_data_dir: str = 'set_data',
+    fix: bool = False,
+    jobs: Optional[int] = None
+) -> List[Dict[str, Any]]:
+
+    file_paths = sorted(
+        os.path.join(set_data_dir, set_file)
+        for set_file in os.listdir(set_data_dir)
+        if set_file.endswith('.txt')
+    )
+    if not file_paths:
+        return []
+
+    worker = _check_set_file_fixing if fix else check_set_file
+    workers = jobs or os.cpu_count() or 1
+
+    # Small collections are not worth the cost of starting processes
+    if workers == 1 or len(file_paths) < 8:
+        return [worker(file_path) for file_path in file_paths]
+
+    chunksize = max(1, len(file_paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(worker, file_paths, chunksize=chunksize))
+
+
+# This fills the thumbnail atlases with every image in the collection,
+# and hashes every part image so Find by Photo has nothing left to do.
+def rebuild_thumbnails(set_data_dir: str = 'set_data') -> int:
+    from .gui.image_atlas import get_atlas
+    from .gui.photo_match import get_photo_index
+
+    part_urls, sticker_urls = set(), set()
+    for set_file in os.listdir(set_data_dir):
+        if not set_file.endswith('.txt'):
+            continue
+        try:
+            with open(os.path.join(set_data_dir, set_file), 'r') as f:
+                data = json.load(f)
+            part_urls.update(part.get("image") for part in data["parts"])
+            sticker_urls.update(
+                sticker.get("image") for sticker in data["stickers"]
+            )
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+
+    for size, urls in ((51, part_urls), (60, part_urls), (100, sticker_urls)):
+        get_atlas(size, set_data_dir).prefetch(urls)
+    get_photo_index(set_data_dir).update(part_urls)
+    return len(part_urls) + len(sticker_urls)
+
+
+# This formats the results of a collection check as readable text.
+def describe_check(results: List[Dict[str, Any]], elapsed: float) -> str:
+    lines: List[str] = []
+    for result in results:
+        for error in result["errors"]:
+            lines.append(f"CORRUPT  {result['set']}: {error}")
+        if result["repairs"]:
+            action = "FIXED   " if result["fixed"] else "NEEDS FIX"
+            lines.append(
+                f"{action} {result['set']}: {len(result['repairs'])} "
+                f"derived field(s) out of date"
+            )
+
+    corrupt = sum(1 for result in results if result["errors"])
+    stale = sum(1 for result in results if result["repairs"])
+    fixed = sum(1 for result in results if result["fixed"])
+    lines.append(
+        f"Checked {len(results)} sets in {elapsed:.2f}s: "
+        f"{corrupt} corrupt, {stale} out of date, {fixed} fixed."
+    )
+    return "\n".join(lines)
+
@@ -0,0 +1,300 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .colors import get_color_index, parse_color
+from .equivalence import get_part_classes, part_class
+from .set_files import (
+    CollectionVersion,
+    collection_version,
+    part_search_words,
+    set_writer,
+)
+
+
+# This splits a part ID into text and numbers so that 3001 sorts before 30010.
+def natural_key(text: str) -> Tuple[Tuple[int, str], ...]:
+    return tuple(
+        (int(piece), '') if piece.isdigit() else (0, piece.lower())
+        for piece in re.findall(r'\d+|\D+', text)
+    )
+
+
+# This sanitizes a search query and splits it into lowercase terms.
+def split_search_terms(input_query: str) -> List[str]:
+    query = "".join(
+        c for c in input_query
+        if c.isalnum() or c in (' ', '-', "'")
+    )
+    return [term.strip().lower() for term in query.split() if term.strip()]
+
+
+# Cached results keep each part's search words for refining searches
+CacheKey = Tuple[str, Tuple[str, ...]]
+CachedResults = Tuple[List[Dict[str, Any]], List[FrozenSet[str]]]
+
+
+# This remembers the results of recent searches. Every entry belongs to
+# one version of its data directory and is dropped once any set file
+# there is written, by this process or another.
+# The server searches from many threads, so entries are only touched
+# while holding the lock.
+class SearchCache:
+    def __init__(self, capacity: int = 64) -> None:
+        self.capacity = capacity
+        self.versions: Dict[str, CollectionVersion] = {}
+        self.entries: "OrderedDict[CacheKey, CachedResults]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Drop a directory's entries from an older collection version
+    def _check_version(
+        self, 
+        directory: str, 
+        version: CollectionVersion
+    ) -> None:
+        
+        if self.versions.get(directory) != version:
+            self.versions[directory] = version
+            for key in [key for key in self.entries if key[0] == directory]:
+                del self.entries[key]
+
+    # Results for the search terms, from an earlier identical search or
+    # by filtering one whose terms are a subset of these
+    def lookup(
+        self, 
+        set_data_dir: str, 
+        terms: Tuple[str, ...], 
+        version: CollectionVersion
+    ) -> Optional[CachedResults]:
+        
+        with self.lock:
+            directory = os.path.abspath(set_data_dir)
+            self._check_version(directory, version)
+            key = (directory, terms)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+            # Start from the narrowest earlier search that this one refines
+            base = None
+            for (entry_dir, entry_terms), entry in self.entries.items():
+                if entry_dir == directory and set(entry_terms) <= set(terms):
+                    if base is None or len(entry[0]) < len(base[0]):
+                        base = entry
+            if base is None:
+                return None
+
+            results: List[Dict[str, Any]] = []
+            words: List[FrozenSet[str]] = []
+            for result, result_words in zip(*base):
+                if all(term in result_words for term in terms):
+                    results.append(result)
+                    words.append(result_words)
+            self._store(key, (results, words))
+            return results, words
+
+    # Remember results read from the given collection version, unless a
+    # set file has been written since
+    def store(
+        self, 
+        set_data_dir: str, 
+        terms: Tuple[str, ...], 
+        entry: CachedResults, 
+        version: CollectionVersion
+    ) -> None:
+        
+        with self.lock:
+            directory = os.path.abspath(set_data_dir)
+            self._check_version(directory, collection_version(set_data_dir))
+            if version == self.versions[directory]:
+                self._store((directory, terms), entry)
+
+    def _store(self, key: CacheKey, entry: CachedResults) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+search_cache = SearchCache()
+
+# Colors searched by default around an approximate color
+NEAREST_COLORS = 3
+
+# This returns a list of set IDs that need a specific part ID.
+# With `equivalents`, alternate, mold and print variants of a part are
+# counted as the same part.
+def search_sets(
+        input_query: str, 
+        set_data_dir: str = 'set_data', 
+        equivalents: bool = False
+) -> List[Dict[str, Any]]:
+    
+    # Sanitize and split the search query
+    search_terms = split_search_terms(input_query)
+
+    # Return empty list if there are no search terms
+    if not search_terms:
+        return []
+    matched = find_needed_parts(search_terms, set_data_dir)
+    if not equivalents or not matched:
+        return matched
+    return merge_equivalent_parts(
+        matched, find_needed_parts([], set_data_dir), 
+        get_part_classes(set_data_dir)
+    )
+
+
+# This merges each matched part with every needed part equivalent to it
+# in the same color, even ones whose own words do not match the search.
+def merge_equivalent_parts(
+        matched: List[Dict[str, Any]], 
+        needed: List[Dict[str, Any]], 
+        part_classes: Dict[str, str]
+) -> List[Dict[str, Any]]:
+    
+    def class_key(result):
+        return (part_class(part_classes, result["part_id"]), result["color"])
+
+    wanted = {class_key(result) for result in matched}
+    groups: Dict[tuple, Dict[str, Any]] = {}
+
+    # Matched parts come first so they name and picture their group
+    for result in matched + needed:
+        key = class_key(result)
+        if key not in wanted:
+            continue
+        group = groups.get(key)
+        if group is None:
+            groups[key] = dict(
+                result, 
+                sets_needing=list(result["sets_needing"]), 
+                equivalent_ids=[result["part_id"]]
+            )
+        elif result["part_id"] not in group["equivalent_ids"]:
+            group["equivalent_ids"].append(result["part_id"])
+            group["total_needed"] += result["total_needed"]
+            group["sets_needing"].extend(
+                set_name for set_name in result["sets_needing"]
+                if set_name not in group["sets_needing"]
+            )
+    return list(groups.values())
+
+
+# This collects every needed part matching all of the search terms, or
+# every needed part when there are none.
+def find_needed_parts(
+        search_terms: List[str], 
+        set_data_dir: str = 'set_data'
+) -> List[Dict[str, Any]]:
+    
+    # Results are copied so windows may patch them without changing the
+    # cached ones
+    def copy_results(results):
+        return [
+            dict(result, sets_needing=list(result["sets_needing"]))
+            for result in results
+        ]
+
+    terms = tuple(sorted(set(search_terms)))
+    version = collection_version(set_data_dir)
+    cached = search_cache.lookup(set_data_dir, terms, version)
+    if cached is not None:
+        return copy_results(cached[0])
+
+    # Collect all unique parts that are still needed from each set
+    needed_parts: Dict[tuple, Dict[str, Any]] = {}
+    part_words: Dict[tuple, FrozenSet[str]] = {}
+    
+    for set_file in os.listdir(set_data_dir):
+        if not set_file.endswith('.txt'):
+            continue
+            
+        file_path = os.path.join(set_data_dir, set_file)
+        set_name = set_file[:-4]
+        try:
+            # Edits still queued for a set are searched as they are, so a
+            # search never forces them to be written early
+            parts = set_writer.snapshot(set_name, set_data_dir)
+            if parts is None:
+                with open(file_path, 'r') as f:
+                    data = json.load(f)
+
+                # Skip completed sets
+                if data.get("set_info", {}).get("completed", False):
+                    continue
+                parts = data["parts"]
+                
+            for part in parts:
+                # Skip completed parts
+                if part["have"] >= part["need"]:
+                    continue
+
+                search_words = part_search_words(part)
+
+                all_terms_match = True
+                for term in search_terms:
+                    if term not in search_words:
+                        all_terms_match = False
+                        break
+
+                if all_terms_match:
+                    part_key = (part["id"], part["color"])
+
+                    # Add info from each needed part
+                    if part_key not in needed_parts:
+                        needed_parts[part_key] = {
+                            "part_id": part["id"],
+                            "name": part["name"],
+                            "category": part["category"],
+                            "color": part["color"],
+                            "image_url": part["image"],
+                            "sets_needing": [],
+                            "total_needed": 0
+                        }
+                        part_words[part_key] = frozenset(search_words)
+                    
+                    needed_parts[part_key]["sets_needing"].append(set_name)
+                    needed_parts[part_key]["total_needed"] += (
+                        part["need"] - part["have"]
+                    )
+                        
+        except (json.JSONDecodeError, KeyError, FileNotFoundError):
+            continue
+    
+    results = list(needed_parts.values())
+    search_cache.store(set_data_dir, terms, (results, [
+        part_words[(result["part_id"], result["color"])]
+        for result in results
+    ]), version)
+    return copy_results(results)
+
+
+# This returns needed parts in the colors closest to the given one,
+# nearest colors first, along with those colors and their distances.
+def search_near_color(
+        input_query: str, 
+        color_text: str, 
+        count: int = NEAREST_COLORS, 
+        set_data_dir: str = 'set_data'
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, float]]]:
+    
+    colors, color_index = get_color_index(set_data_dir)
+    nearest = color_index.nearest(parse_color(color_text, colors), count)
+    distances = dict(nearest)
+
+    results = [
+        result for result in find_needed_parts(
+            split_search_terms(input_query), set_data_dir
+        )
+        if result["color"] in distances
+    ]
+    for result in results:
+        result["color_distance"] = round(distances[result["color"]], 1)
+    results.sort(key=lambda result: (
+        result["color_distance"], natural_key(result["part_id"])
+    ))
+    return results, nearest
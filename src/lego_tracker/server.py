@@ -0,0 +1,368 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from .allocation import (
+    PartKey,
+    PartLabels,
+    allocate_parts,
+    get_need_index,
+    part_key,
+)
+from .search import search_near_color, search_sets
+from .set_files import (
+    apply_have_changes,
+    have_change_events,
+    list_set_titles,
+    load_set_data,
+    set_writer,
+)
+from .state_bus import state_bus
+
+# Fields of each part sent to clients
+PART_FIELDS = ["id", "name", "category", "color", "need", "have", "image"]
+
+
+# This is raised for a set title with no set file, and answered with 404.
+class UnknownSetError(KeyError):
+    pass
+
+
+# This holds every set the server has opened in memory. Updates to a set
+# are applied under that set's lock and handed to the shared set writer,
+# which merges everything queued for a set into one file write.
+class SetStore:
+    def __init__(self, set_data_dir: str = 'set_data') -> None:
+        self.set_data_dir = set_data_dir
+        self.sets: Dict[str, List[Dict[str, Any]]] = {}
+        self.locks: Dict[str, threading.Lock] = {}
+        self.guard = threading.Lock()
+
+    def lock_for(self, set_title: str) -> threading.Lock:
+        with self.guard:
+            return self.locks.setdefault(set_title, threading.Lock())
+
+    # Parts of a set, read from its file the first time it is used.
+    # The caller must hold the set's lock.
+    def _parts(self, set_title: str) -> List[Dict[str, Any]]:
+        if set_title not in self.sets:
+            if set_title not in list_set_titles(self.set_data_dir):
+                raise UnknownSetError(set_title)
+            self.sets[set_title] = load_set_data(
+                set_title, self.set_data_dir
+            )[0]
+        return self.sets[set_title]
+
+    # A copy of a set's parts, each with its index in the set
+    def get_parts(self, set_title: str) -> List[Dict[str, Any]]:
+        with self.lock_for(set_title):
+            return [
+                dict(
+                    {field: part[field] for field in PART_FIELDS}, index=i
+                )
+                for i, part in enumerate(self._parts(set_title))
+            ]
+
+    # Totals for every set in the collection
+    def summary(self) -> List[Dict[str, Any]]:
+        sets = []
+        for set_title in list_set_titles(self.set_data_dir):
+            with self.lock_for(set_title):
+                parts = self._parts(set_title)
+                need = sum(part["need"] for part in parts)
+                have = sum(part["have"] for part in parts)
+            sets.append({
+                "title": set_title,
+                "need": need,
+                "have": have,
+                "completed": have >= need
+            })
+        return sets
+
+    # Apply "have" updates to a set and return the change events.
+    # Each update names a part by "index" or by "id" and "color", and
+    # gives either "add" (may be negative) or an absolute "have".
+    def update(
+        self,
+        set_title: str,
+        updates: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+
+        from .transfer import resolve_updates
+
+        with self.lock_for(set_title):
+            parts = self._parts(set_title)
+
+            # Check every update before any count is changed
+            by_index: List[Tuple[int, Tuple[str, int]]] = []
+            by_key: Dict[PartKey, List[Tuple[str, int]]] = {}
+            for update in updates:
+                change = parse_update(update)
+                if "index" in update:
+                    index = update["index"]
+                    if (
+                        not is_whole_number(index) or
+                        not 0 <= index < len(parts)
+                    ):
+                        raise ValueError(f"No part at index {index!r}.")
+                    by_index.append((index, change))
+                elif "id" in update and "color" in update:
+                    key = part_key(str(update["id"]), str(update["color"]))
+                    by_key.setdefault(key, []).append(change)
+                else:
+                    raise ValueError(
+                        "Each update needs an index, or an id and color."
+                    )
+
+            # Updates by index apply in order, then those by part
+            changes: Dict[int, int] = {}
+            for index, (mode, count) in by_index:
+                current = changes.get(index, parts[index]["have"])
+                changes[index] = count if mode == "set" else current + count
+            previous = apply_have_changes(parts, changes)
+            changes = resolve_updates(parts, by_key)
+            for index, old_have in apply_have_changes(parts, changes).items():
+                previous.setdefault(index, old_have)
+
+            previous = {
+                index: old_have for index, old_have in previous.items()
+                if parts[index]["have"] != old_have
+            }
+            if previous:
+                set_writer.schedule(set_title, parts, self.set_data_dir)
+            events = have_change_events(parts, previous)
+
+        if events:
+            state_bus.publish(
+                "have_changed", set_title=set_title,
+                set_data_dir=self.set_data_dir, parts=events, source=self
+            )
+        return events
+
+    # Give found parts to the sets that need them, as "Allocate" does
+    def allocate(
+        self,
+        found: Dict[PartKey, int],
+        labels: PartLabels,
+        apply: bool = False
+    ) -> Dict[str, Any]:
+
+        set_writer.flush()
+        index = get_need_index(self.set_data_dir)
+        allocation = allocate_parts(found, index, labels)
+
+        def describe(parts: Dict[PartKey, int]) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "id": allocation["labels"][key][0],
+                    "color": allocation["labels"][key][1],
+                    "quantity": qty
+                }
+                for key, qty in sorted(parts.items())
+            ]
+
+        result = {
+            "assignments": {
+                set_title: describe(parts)
+                for set_title, parts in allocation["assignments"].items()
+            },
+            "completed": allocation["completed"],
+            "leftover": describe(allocation["leftover"])
+        }
+        if apply:
+            for set_title, parts in result["assignments"].items():
+                self.update(set_title, [
+                    {"id": part["id"], "color": part["color"],
+                     "add": part["quantity"]}
+                    for part in parts
+                ])
+        return result
+
+
+# This checks for a whole number. bool is a subclass of int, so it is
+# ruled out explicitly.
+def is_whole_number(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# This reads the mode and count of one update.
+def parse_update(update: Dict[str, Any]) -> Tuple[str, int]:
+    if is_whole_number(update.get("add")):
+        return ("add", update["add"])
+    if is_whole_number(update.get("have")):
+        if update["have"] < 0:
+            raise ValueError("'have' cannot be negative.")
+        return ("set", update["have"])
+    raise ValueError("Each update needs a whole number 'add' or 'have'.")
+
+
+# This answers the JSON API for one request.
+class RequestHandler(BaseHTTPRequestHandler):
+    server: "CollectionServer"
+
+    def send_json(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ValueError("Request body is not valid JSON.")
+
+    # Path segments after the leading slash, URL-decoded
+    def path_parts(self) -> List[str]:
+        path = urlparse(self.path).path
+        return [unquote(part) for part in path.strip('/').split('/') if part]
+
+    def do_GET(self) -> None:
+        self.handle_request(self.route_get)
+
+    def do_POST(self) -> None:
+        self.handle_request(self.route_post)
+
+    def handle_request(self, route: Any) -> None:
+        try:
+            status, body = route(self.path_parts())
+        except UnknownSetError as e:
+            status, body = 404, {"error": f"No set named {e.args[0]}."}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            # Any other failure still answers, rather than dropping the
+            # connection
+            self.log_error("%s: %r", self.path, e)
+            status, body = 500, {"error": f"Server error: {e}"}
+        self.send_json(status, body)
+
+    def route_get(self, parts: List[str]) -> Tuple[int, Any]:
+        store = self.server.store
+        if parts == ["sets"]:
+            return 200, store.summary()
+        if len(parts) == 2 and parts[0] == "sets":
+            return 200, {"title": parts[1], "parts": store.get_parts(parts[1])}
+        if parts == ["search"]:
+            params = parse_qs(urlparse(self.path).query)
+            query = params.get("q", [""])[0]
+            if "color" not in params:
+                equivalents = params.get("equivalent", ["0"])[0] == "1"
+                return 200, search_sets(
+                    query, store.set_data_dir, equivalents
+                )
+
+            # Needed parts in the colors nearest to an approximate one
+            try:
+                count = int(params.get("n", ["3"])[0])
+            except ValueError:
+                raise ValueError("'n' must be a whole number.")
+            results, nearest = search_near_color(
+                query, params["color"][0], count, store.set_data_dir
+            )
+            return 200, {"colors": nearest, "results": results}
+        return 404, {"error": "Unknown path."}
+
+    def route_post(self, parts: List[str]) -> Tuple[int, Any]:
+        store = self.server.store
+        body = self.read_json()
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object.")
+
+        if len(parts) == 3 and parts[0] == "sets" and parts[2] == "parts":
+            updates = body.get("updates")
+            if not isinstance(updates, list) or not all(
+                isinstance(update, dict) for update in updates
+            ):
+                raise ValueError("'updates' must be a list of objects.")
+            return 200, {"changed": store.update(parts[1], updates)}
+
+        if parts == ["allocate"]:
+            found: Dict[PartKey, int] = {}
+            labels: PartLabels = {}
+            for part in body.get("parts") or []:
+                quantity = part.get("quantity", 1) if isinstance(
+                    part, dict
+                ) else None
+                if (
+                    not isinstance(part, dict) or "id" not in part or
+                    "color" not in part or not is_whole_number(quantity) or
+                    quantity < 1
+                ):
+                    raise ValueError(
+                        "Each part needs an id, color and whole quantity."
+                    )
+                part_id, color = str(part["id"]), str(part["color"])
+                key = part_key(part_id, color)
+                found[key] = found.get(key, 0) + quantity
+                labels.setdefault(key, (part_id, color))
+            return 200, store.allocate(found, labels, bool(body.get("apply")))
+
+        return 404, {"error": "Unknown path."}
+
+    # Only log errors, not every request from every sorter
+    def log_request(self, code: Any = '-', size: Any = '-') -> None:
+        if isinstance(code, int) and code >= 400:
+            super().log_request(code, size)
+
+
+# This serves the collection over HTTP, one thread per request.
+class CollectionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Many sorters may connect at the same moment
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        set_data_dir: str = 'set_data'
+    ) -> None:
+
+        super().__init__(address, RequestHandler)
+        self.store = SetStore(set_data_dir)
+
+    # Stop serving and write every queued update
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+        set_writer.flush()
+
+
+# This starts a server on a background thread, mainly for scripts and
+# tests. Port 0 picks any free port; see server_address for the result.
+def start_server(
+    host: str = '127.0.0.1',
+    port: int = 0,
+    set_data_dir: str = 'set_data'
+) -> CollectionServer:
+
+    server = CollectionServer((host, port), set_data_dir)
+    thread = threading.Thread(
+        target=server.serve_forever, name='CollectionServer', daemon=True
+    )
+    thread.start()
+    return server
+
+
+# This runs a server until it is interrupted.
+def serve(
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    set_data_dir: str = 'set_data'
+) -> None:
+
+    server = CollectionServer((host, port), set_data_dir)
+    print(f"Serving {set_data_dir} on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        set_writer.flush()
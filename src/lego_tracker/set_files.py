@@ -0,0 +1,453 @@
+import json
+import os
+import re
+import stat
+import tempfile
+import threading
+import time
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+)
+
+from .state_bus import state_bus
+
+
+# Split text into individual words for searching
+def split_into_search_words(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    # Split on spaces, commas, parentheses, and other common delimiters
+    words = re.split(r'[\s,\(\)\[\]\/\-]+', text.lower())
+    return [word.strip() for word in words if word.strip()]
+
+
+# Writing or queueing a set file in this process bumps the collection
+# version, so anything cached from the set files can tell it is out of
+# date. The data directory's mtime, which changes whenever a file in it
+# is replaced or removed, covers writes from other processes.
+CollectionVersion = Tuple[int, int]
+
+_collection_version = 0
+_version_lock = threading.Lock()
+
+def collection_version(set_data_dir: str = 'set_data') -> CollectionVersion:
+    try:
+        stamp = os.stat(set_data_dir).st_mtime_ns
+    except OSError:
+        stamp = 0
+    return (_collection_version, stamp)
+
+def bump_collection_version() -> None:
+    global _collection_version
+    with _version_lock:
+        _collection_version += 1
+
+
+# Files created here get the permissions a plain open() would give them.
+# The umask can only be read by setting it, so it is read once at import.
+_umask = os.umask(0)
+os.umask(_umask)
+
+# This gets the mode a file being replaced should keep, as temporary
+# files are only readable by their owner.
+def replacement_mode(file_path: str) -> int:
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_umask
+
+
+# This writes JSON through a temporary file so a crash never leaves a
+# half-written file behind.
+def write_json_atomic(
+    file_path: str, 
+    data: Any, 
+    indent: Optional[int] = 2
+) -> None:
+    
+    directory = os.path.dirname(file_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(file_path)}.", suffix='.tmp', dir=directory
+    )
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, replacement_mode(file_path))
+        os.replace(tmp_path, file_path)
+
+        # Set files are the only .txt files in the data directory
+        if file_path.endswith('.txt'):
+            bump_collection_version()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# This saves set updates on a background thread, merging rapid updates
+# to the same set into a single write. A write that fails is kept and
+# tried again, and the first failure is published as "save_failed".
+class SetWriter:
+    def __init__(
+        self, 
+        write: Callable[[str, List[Dict[str, Any]], str], None], 
+        delay: float = 0.5,
+        retry_delay: float = 5.0
+    ) -> None:
+        
+        self.write = write
+        self.delay = delay
+        self.retry_delay = retry_delay
+
+        # Latest parts snapshot and due time for each (directory, title)
+        self.pending: Dict[
+            Tuple[str, str], Tuple[float, List[Dict[str, Any]]]
+        ] = {}
+        # Snapshot of each set being written right now
+        self.writing: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        # Sets whose last write failed
+        self.failed: Set[Tuple[str, str]] = set()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    # Queue a save, replacing any update to the same set not yet written
+    def schedule(
+        self, 
+        set_title: str, 
+        parts_data: List[Dict[str, Any]], 
+        set_data_dir: str = 'set_data'
+    ) -> None:
+        
+        snapshot = [dict(part) for part in parts_data]
+        key = (set_data_dir, set_title)
+        with self.condition:
+            # Keep the first due time so constant edits still get written
+            if key in self.pending:
+                due = self.pending[key][0]
+            else:
+                due = time.monotonic() + self.delay
+            self.pending[key] = (due, snapshot)
+
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='SetWriter', daemon=True
+                )
+                self.thread.start()
+            self.condition.notify_all()
+
+        # Searches read queued updates, so their cached results are stale
+        bump_collection_version()
+
+    # The latest parts queued or being written for a set, if any
+    def snapshot(
+        self, 
+        set_title: str, 
+        set_data_dir: str = 'set_data'
+    ) -> Optional[List[Dict[str, Any]]]:
+        
+        key = (set_data_dir, set_title)
+        with self.condition:
+            if key in self.pending:
+                return self.pending[key][1]
+            return self.writing.get(key)
+
+    # Claim a pending update once no other write of that set is running
+    def _take(
+        self, 
+        key: Tuple[str, str]
+    ) -> Optional[List[Dict[str, Any]]]:
+        
+        while key in self.writing:
+            self.condition.wait()
+        if key not in self.pending:
+            return None
+        self.writing[key] = self.pending.pop(key)[1]
+        return self.writing[key]
+
+    def _write(
+        self, 
+        key: Tuple[str, str], 
+        parts: List[Dict[str, Any]]
+    ) -> None:
+        
+        try:
+            self.write(key[1], parts, key[0])
+        except Exception as e:
+            print(f"Could not save set {key[1]}: {e}")
+            with self.condition:
+                # Retry later unless a newer update has been queued
+                if key not in self.pending:
+                    self.pending[key] = (
+                        time.monotonic() + self.retry_delay, parts
+                    )
+                first_failure = key not in self.failed
+                self.failed.add(key)
+            if first_failure:
+                state_bus.publish(
+                    "save_failed", set_title=key[1], set_data_dir=key[0],
+                    error=str(e)
+                )
+        else:
+            with self.condition:
+                self.failed.discard(key)
+        finally:
+            with self.condition:
+                self.writing.pop(key, None)
+                self.condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                ready = [
+                    (due, key) for key, (due, _) in self.pending.items()
+                    if key not in self.writing
+                ]
+                if not ready:
+                    self.condition.wait()
+                    continue
+                due, key = min(ready)
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                parts = self._take(key)
+            if parts is not None:
+                self._write(key, parts)
+
+    # Write pending updates now, for one set or for every set
+    def flush(
+        self, 
+        set_title: Optional[str] = None, 
+        set_data_dir: str = 'set_data'
+    ) -> None:
+        
+        with self.condition:
+            if set_title is None:
+                keys = list(self.pending) + list(self.writing)
+            else:
+                keys = [(set_data_dir, set_title)]
+
+        for key in keys:
+            with self.condition:
+                parts = self._take(key)
+            if parts is not None:
+                self._write(key, parts)
+
+
+# This loads the data from a set ID's .txt file.
+def load_set_data(
+        set_title: str, 
+        set_data_dir: str = 'set_data'
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    
+    # Make sure no queued update to this set is still waiting to be written
+    set_writer.flush(set_title, set_data_dir)
+    with open(os.path.join(set_data_dir, f"{set_title}.txt"), 'r') as f:
+        data = json.load(f)
+    return data["parts"], data["stickers"]
+
+
+# This saves any updates to the set's data.
+def save_set_data(
+    set_title: str, 
+    parts_data: List[Dict[str, Any]], 
+    set_data_dir: str = 'set_data'
+) -> None:
+    
+    filepath = os.path.join(set_data_dir, f"{set_title}.txt")
+    
+    # Load existing data to preserve set_info and stickers
+    with open(filepath, 'r') as f:
+        existing_data = json.load(f)
+
+    # Update the parts data, keeping fields the window did not load
+    old_parts = existing_data["parts"]
+    if len(old_parts) == len(parts_data):
+        parts_data = [
+            {**old_part, **part} 
+            for old_part, part in zip(old_parts, parts_data)
+        ]
+
+    # Parts that still lack search words get them rebuilt, so they never
+    # drop out of search
+    parts_data = [
+        part if 'search_words' in part 
+        else dict(part, search_words=part_search_words(part))
+        for part in parts_data
+    ]
+    existing_data["parts"] = parts_data
+
+    # Check if set is complete or incomplete
+    all_complete = all(part["have"] >= part["need"] for part in parts_data)
+    existing_data["set_info"]["completed"] = all_complete
+
+    # A restored set may be archived again once it has been edited
+    existing_data["set_info"].pop("restored", None)
+    existing_data["set_info"]["parts_found"] = sum(
+        part["have"] for part in parts_data
+    )
+
+    write_json_atomic(filepath, existing_data)
+
+
+# Saves from every window go through one background writer
+set_writer = SetWriter(save_set_data)
+
+# This applies a batch of "have" changes and returns the previous values.
+def apply_have_changes(
+    parts_data: List[Dict[str, Any]], 
+    changes: Dict[int, int]
+) -> Dict[int, int]:
+    
+    previous: Dict[int, int] = {}
+    for index, value in changes.items():
+        # Keep every value between 0 and the amount needed
+        value = max(0, min(value, parts_data[index]['need']))
+        if parts_data[index]['have'] != value:
+            previous[index] = parts_data[index]['have']
+            parts_data[index]['have'] = value
+    return previous
+
+
+# This gets a part's search words, rebuilding them if they were skipped
+# when the set was loaded.
+def part_search_words(part: Dict[str, Any]) -> List[str]:
+    if 'search_words' in part:
+        return part['search_words']
+    return split_into_search_words(
+        f"{part['id']} {part['name']} {part['category']} {part['color']}"
+    )
+
+
+# This describes changed "have" counts for the state bus.
+def have_change_events(
+    parts_data: List[Dict[str, Any]], 
+    previous: Dict[int, int]
+) -> List[Dict[str, Any]]:
+    
+    return [
+        {
+            "index": index,
+            "id": parts_data[index]['id'],
+            "color": parts_data[index]['color'],
+            "need": parts_data[index]['need'],
+            "old_have": old_have,
+            "have": parts_data[index]['have'],
+            "search_words": part_search_words(parts_data[index])
+        }
+        for index, old_have in previous.items()
+    ]
+
+
+# This reads a set file a piece at a time without loading it whole.
+# Top-level values are yielded as (key, value) in file order, except
+# lists, which are yielded one (key, item) at a time. Fields named in
+# skip_fields are dropped from each list item.
+def iter_set_file(
+    file_path: str, 
+    skip_fields: Iterable[str] = (), 
+    chunk_size: int = 1 << 16
+) -> Iterator[Tuple[str, Any]]:
+    
+    decoder = json.JSONDecoder()
+    skip_fields = tuple(skip_fields)
+    buffer = ''
+    pos = 0
+    eof = False
+
+    with open(file_path, 'r') as f:
+        # Drop what has been parsed and read the next chunk
+        def read_more() -> None:
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        # Next non-space character, or '' at the end of the file
+        def peek() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return buffer[pos:pos + 1]
+                read_more()
+
+        def expect(chars: str) -> str:
+            nonlocal pos
+            char = peek()
+            if not char or char not in chars:
+                raise ValueError(
+                    f"{file_path}: expected {' or '.join(chars)} "
+                    f"but found {char or 'end of file'}"
+                )
+            pos += 1
+            return char
+
+        # Decode one complete value, reading more until it fits
+        def decode() -> Any:
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number cut off by the chunk edge may still go on
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+
+        expect('{')
+        if peek() == '}':
+            return
+        while True:
+            key = decode()
+            expect(':')
+            if peek() != '[':
+                yield key, decode()
+            else:
+                expect('[')
+                if peek() == ']':
+                    expect(']')
+                else:
+                    while True:
+                        item = decode()
+                        if isinstance(item, dict):
+                            for field in skip_fields:
+                                item.pop(field, None)
+                        yield key, item
+                        if expect(',]') == ']':
+                            break
+            if expect(',}') == '}':
+                return
+
+
+# This lists the titles of every set file in the data directory.
+def list_set_titles(set_data_dir: str = 'set_data') -> List[str]:
+    return sorted(
+        set_file[:-4] for set_file in os.listdir(set_data_dir)
+        if set_file.endswith('.txt')
+    )
+
+
+# This yields each set file's title and data, one set at a time.
+def iter_set_files(
+    set_data_dir: str = 'set_data', 
+    set_titles: Optional[Iterable[str]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    
+    if set_titles is None:
+        set_titles = list_set_titles(set_data_dir)
+    for set_title in set_titles:
+        file_path = os.path.join(set_data_dir, f"{set_title}.txt")
+        try:
+            with open(file_path, 'r') as f:
+                yield set_title, json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            continue
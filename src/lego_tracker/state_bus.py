@@ -0,0 +1,46 @@
+from typing import Any, Callable, Dict, List
+
+# Topics published on the bus:
+#   "have_changed": set_title, set_data_dir, parts, source
+#       parts is a list of {"index", "id", "color", "need", "old_have",
+#       "have", "search_words"} for every part whose count changed;
+#       search_words lets open searches tell whether a part needed again
+#       matches their terms
+#   "set_replaced": set_title, set_data_dir
+#       the set's parts list was rewritten, e.g. by a re-sync
+#   "sets_changed": set_data_dir
+#       sets were added to or removed from the collection
+#   "save_failed": set_title, set_data_dir, error
+#       a queued update could not be written and will be tried again;
+#       published from the writer's thread
+Callback = Callable[..., None]
+
+
+# This passes collection updates between open windows in one process.
+# Callbacks run on the publishing thread, so Tk windows must only be
+# updated from events published on the main thread.
+class StateBus:
+    def __init__(self) -> None:
+        self.subscribers: Dict[str, List[Callback]] = {}
+
+    # Register a callback, returning a function that removes it again
+    def subscribe(self, topic: str, callback: Callback) -> Callable[[], None]:
+        self.subscribers.setdefault(topic, []).append(callback)
+
+        def unsubscribe() -> None:
+            callbacks = self.subscribers.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+        return unsubscribe
+
+    def publish(self, topic: str, **event: Any) -> None:
+        # Copy first so callbacks may unsubscribe while being called
+        for callback in list(self.subscribers.get(topic, [])):
+            try:
+                callback(**event)
+            except Exception as e:
+                print(f"Error handling '{topic}' update: {e}")
+
+
+# Every window in the app shares one bus
+state_bus = StateBus()
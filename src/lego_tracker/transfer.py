@@ -0,0 +1,338 @@
+import csv
+import xml.etree.ElementTree as ET
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
+from xml.sax.saxutils import escape
+
+from .allocation import PartKey, allocate_parts, get_need_index, part_key
+from .colors import color_name_for_bricklink, load_color_table
+from .equivalence import get_part_classes, part_class
+from .set_files import (
+    apply_have_changes,
+    have_change_events,
+    iter_set_files,
+    list_set_titles,
+    load_set_data,
+    save_set_data,
+)
+from .state_bus import state_bus
+
+PER_SET_COLUMNS = ["set", "part_id", "color", "need", "have", "remaining"]
+AGGREGATE_COLUMNS = ["part_id", "color", "remaining", "sets"]
+
+
+# This yields the remaining need of each part, one set at a time.
+def iter_remaining(
+    set_data_dir: str = 'set_data',
+    set_titles: Optional[List[str]] = None
+) -> Iterator[Dict[str, Any]]:
+
+    for set_title, data in iter_set_files(set_data_dir, set_titles):
+        if data.get("set_info", {}).get("completed", False):
+            continue
+        for part in data.get("parts", []):
+            remaining = part["need"] - part["have"]
+            if remaining > 0:
+                yield {
+                    "set": set_title,
+                    "part_id": part["id"],
+                    "color": part["color"],
+                    "need": part["need"],
+                    "have": part["have"],
+                    "remaining": remaining
+                }
+
+
+# This totals the remaining need per (part, color) across every set.
+# Only one row per distinct part is held, never the set files themselves.
+# With part_classes, equivalent parts are totalled under one part ID.
+def aggregate_remaining(
+    rows: Iterator[Dict[str, Any]],
+    part_classes: Optional[Dict[str, str]] = None
+) -> Iterator[Dict[str, Any]]:
+
+    totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    titles: Dict[Tuple[str, str], Set[str]] = {}
+    for row in rows:
+        part_id = row["part_id"]
+        if part_classes is not None:
+            part_id = part_class(part_classes, part_id)
+        key = (part_id, row["color"])
+        if key not in totals:
+            totals[key] = {
+                "part_id": part_id,
+                "color": row["color"],
+                "remaining": 0,
+                "sets": 0
+            }
+        totals[key]["remaining"] += row["remaining"]
+
+        # A set listing the part more than once still counts as one set
+        titles.setdefault(key, set()).add(row["set"])
+        totals[key]["sets"] = len(titles[key])
+    for key in sorted(totals):
+        yield totals[key]
+
+
+# This writes remaining need as CSV.
+def export_csv(
+    out: TextIO,
+    set_data_dir: str = 'set_data',
+    set_titles: Optional[List[str]] = None,
+    aggregate: bool = False,
+    equivalents: bool = False
+) -> int:
+
+    rows = iter_remaining(set_data_dir, set_titles)
+    if aggregate:
+        rows = aggregate_remaining(
+            rows, get_part_classes(set_data_dir) if equivalents else None
+        )
+    writer = csv.DictWriter(
+        out, fieldnames=AGGREGATE_COLUMNS if aggregate else PER_SET_COLUMNS
+    )
+    writer.writeheader()
+
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+# This writes remaining need as a BrickLink wanted list.
+def export_bricklink_xml(
+    out: TextIO,
+    set_data_dir: str = 'set_data',
+    set_titles: Optional[List[str]] = None,
+    aggregate: bool = False,
+    equivalents: bool = False
+) -> Tuple[int, List[str]]:
+
+    colors = load_color_table(set_data_dir)
+    rows = iter_remaining(set_data_dir, set_titles)
+    if aggregate:
+        rows = aggregate_remaining(
+            rows, get_part_classes(set_data_dir) if equivalents else None
+        )
+
+    count = 0
+    unmapped = set()
+    out.write("<INVENTORY>\n")
+    for row in rows:
+        out.write("  <ITEM>\n    <ITEMTYPE>P</ITEMTYPE>\n")
+        out.write(f"    <ITEMID>{escape(row['part_id'])}</ITEMID>\n")
+
+        # Items without a BrickLink color are left for any color
+        bricklink_color = colors.get(row["color"], {}).get("bricklink")
+        if bricklink_color is None:
+            unmapped.add(row["color"])
+        else:
+            out.write(f"    <COLOR>{bricklink_color}</COLOR>\n")
+        out.write(f"    <MINQTY>{row['remaining']}</MINQTY>\n")
+
+        # The set title lets an import send filled parts back to it
+        if "set" in row:
+            out.write(f"    <REMARKS>{escape(row['set'])}</REMARKS>\n")
+        out.write("  </ITEM>\n")
+        count += 1
+    out.write("</INVENTORY>\n")
+    return count, sorted(unmapped)
+
+
+# An update is ("set", count) for an absolute value or ("add", count)
+Update = Tuple[str, int]
+
+
+# This reads "have" updates from a CSV file, one row at a time.
+def read_csv_updates(
+    source: TextIO
+) -> Iterator[Tuple[Optional[str], PartKey, Update]]:
+
+    reader = csv.DictReader(source)
+    for line_num, row in enumerate(reader, 2):
+        set_title = (row.get("set") or "").strip() or None
+        part_id = (row.get("part_id") or "").strip()
+        color = (row.get("color") or "").strip()
+        if not part_id or not color:
+            raise ValueError(f"Line {line_num}: missing part_id or color.")
+
+        # "have" replaces a set's count; "found" adds to it
+        try:
+            if row.get("have") not in (None, "") and set_title:
+                update = ("set", int(row["have"]))
+            elif row.get("found") not in (None, ""):
+                update = ("add", int(row["found"]))
+            else:
+                continue
+        except ValueError:
+            raise ValueError(f"Line {line_num}: count is not a number.")
+        yield set_title, part_key(part_id, color), update
+
+
+# This reads filled quantities from a BrickLink wanted list.
+def read_bricklink_updates(
+    source: TextIO,
+    set_data_dir: str = 'set_data'
+) -> Iterator[Tuple[Optional[str], PartKey, Update]]:
+
+    colors = load_color_table(set_data_dir)
+    try:
+        for _, element in ET.iterparse(source, events=("end",)):
+            if element.tag != "ITEM":
+                continue
+
+            part_id = (element.findtext("ITEMID") or "").strip()
+            try:
+                filled = int(element.findtext("QTYFILLED") or 0)
+            except ValueError:
+                raise ValueError(f"Item {part_id}: quantity is not a number.")
+            color_id = element.findtext("COLOR")
+            color = None
+            if color_id and color_id.strip().isdigit():
+                color = color_name_for_bricklink(colors, int(color_id))
+            set_title = (element.findtext("REMARKS") or "").strip() or None
+            element.clear()
+
+            if part_id and color and filled > 0:
+                yield set_title, part_key(part_id, color), ("add", filled)
+    except ET.ParseError as e:
+        raise ValueError(f"Not a valid wanted list: {e}")
+
+
+# This applies streamed updates, loading and saving one set at a time.
+def import_updates(
+    updates: Iterator[Tuple[Optional[str], PartKey, Update]],
+    set_data_dir: str = 'set_data',
+    dry_run: bool = False
+) -> Dict[str, Any]:
+
+    known_sets = set(list_set_titles(set_data_dir))
+    skipped: Dict[str, int] = {}
+    by_set: Dict[str, Dict[PartKey, List[Update]]] = {}
+    absolute: Dict[str, Dict[PartKey, List[int]]] = {}
+    unassigned: Dict[PartKey, int] = {}
+    for set_title, key, update in updates:
+        # Absolute counts are kept per row, as one set may list a part
+        # more than once
+        if set_title in known_sets and update[0] == "set":
+            set_counts = absolute.setdefault(set_title, {})
+            set_counts.setdefault(key, []).append(update[1])
+            by_set.setdefault(set_title, {})
+        elif set_title in known_sets:
+            set_updates = by_set.setdefault(set_title, {})
+            set_updates.setdefault(key, []).append(update)
+        elif update[0] == "add":
+            unassigned[key] = unassigned.get(key, 0) + update[1]
+        else:
+            # Counts for a set that is archived or was never added have
+            # nowhere to go
+            skipped[set_title] = skipped.get(set_title, 0) + 1
+
+    # Found parts without a set are spread over the sets that need them
+    if unassigned:
+        allocation = allocate_parts(unassigned, get_need_index(set_data_dir))
+        for set_title, parts in allocation["assignments"].items():
+            set_updates = by_set.setdefault(set_title, {})
+            for key, qty in parts.items():
+                set_updates.setdefault(key, []).append(("add", qty))
+
+    summary: Dict[str, Any] = {
+        "sets": 0, "parts": 0, "skipped": skipped
+    }
+    for set_title, set_updates in by_set.items():
+        parts_data, _ = load_set_data(set_title, set_data_dir)
+
+        # Absolute counts apply first, then counts added to them
+        previous = apply_have_changes(parts_data, match_absolute_counts(
+            parts_data, absolute.get(set_title, {})
+        ))
+        changes = resolve_updates(parts_data, set_updates)
+        for index, old_have in apply_have_changes(parts_data, changes).items():
+            previous.setdefault(index, old_have)
+        previous = {
+            index: old_have for index, old_have in previous.items()
+            if parts_data[index]["have"] != old_have
+        }
+        if not previous:
+            continue
+        summary["sets"] += 1
+        summary["parts"] += len(previous)
+        if dry_run:
+            continue
+
+        save_set_data(set_title, parts_data, set_data_dir)
+        state_bus.publish(
+            "have_changed", set_title=set_title, set_data_dir=set_data_dir,
+            parts=have_change_events(parts_data, previous), source=None
+        )
+    return summary
+
+
+# This matches absolute counts to the entries of each (ID, color), one
+# row per entry in order. Exports leave out finished entries, so rows may
+# line up with the unfinished entries instead. Rows that match neither
+# way have their total spread over the entries.
+def match_absolute_counts(
+    parts_data: List[Dict[str, Any]],
+    set_counts: Dict[PartKey, List[int]]
+) -> Dict[int, int]:
+
+    entries: Dict[PartKey, List[int]] = {}
+    for i, part in enumerate(parts_data):
+        key = part_key(part["id"], part["color"])
+        entries.setdefault(key, []).append(i)
+
+    changes: Dict[int, int] = {}
+    for key, counts in set_counts.items():
+        indices = entries.get(key, [])
+        unfinished = [
+            i for i in indices if parts_data[i]["have"] < parts_data[i]["need"]
+        ]
+        if len(counts) != len(indices) and len(counts) == len(unfinished):
+            indices = unfinished
+
+        if len(counts) == len(indices):
+            changes.update(zip(indices, counts))
+        elif indices:
+            changes.update(resolve_updates(
+                parts_data, {key: [("set", sum(counts))]}
+            ))
+    return changes
+
+
+# This works out the new "have" count of each part index, spreading
+# counts over duplicate (ID, color) entries in order.
+def resolve_updates(
+    parts_data: List[Dict[str, Any]],
+    set_updates: Dict[PartKey, List[Update]]
+) -> Dict[int, int]:
+
+    entries: Dict[PartKey, List[int]] = {}
+    for i, part in enumerate(parts_data):
+        key = part_key(part["id"], part["color"])
+        entries.setdefault(key, []).append(i)
+
+    changes: Dict[int, int] = {}
+    for key, updates in set_updates.items():
+        indices = entries.get(key, [])
+        if not indices:
+            continue
+        total = sum(parts_data[i]["have"] for i in indices)
+        for mode, count in updates:
+            total = count if mode == "set" else total + count
+
+        for i in indices:
+            value = max(0, min(total, parts_data[i]["need"]))
+            total -= value
+            if parts_data[i]["have"] != value:
+                changes[i] = value
+    return changes
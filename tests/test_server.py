@@ -0,0 +1,140 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+import pytest
+
+from lego_tracker.server import start_server
+
+SET_TITLE = "1 - Test Set"
+
+
+def make_part(part_id, color, need, have=0):
+    return {
+        "id": part_id, "name": f"Brick {part_id}", "category": "Bricks",
+        "color": color, "need": need, "have": have, "image": None,
+        "search_words": ["brick", part_id.lower(), color.lower()]
+    }
+
+
+@pytest.fixture
+def server(tmp_path):
+    set_data = {
+        "set_info": {
+            "set_id": "1", "name": "Test Set", "completed": False,
+            "parts_found": 0, "notes": ""
+        },
+        "parts": [
+            make_part("3001", "Red", 1000), make_part("3002", "Blue", 5)
+        ],
+        "stickers": []
+    }
+    with open(tmp_path / f"{SET_TITLE}.txt", 'w') as f:
+        json.dump(set_data, f)
+
+    server = start_server(set_data_dir=str(tmp_path))
+    yield server
+    server.close()
+
+
+def request(server, method, path, body=None):
+    host, port = server.server_address[:2]
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(
+        f"http://{host}:{port}{path}", data=data, method=method,
+        headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def set_file(server):
+    server.close()
+    path = f"{server.store.set_data_dir}/{SET_TITLE}.txt"
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def test_concurrent_increments_are_all_kept(server):
+    path = f"/sets/{quote(SET_TITLE)}/parts"
+    errors = []
+
+    def sorter():
+        for _ in range(25):
+            status, _ = request(
+                server, "POST", path, {"updates": [{"index": 0, "add": 1}]}
+            )
+            if status != 200:
+                errors.append(status)
+
+    threads = [threading.Thread(target=sorter) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert set_file(server)["parts"][0]["have"] == 16 * 25
+
+
+@pytest.mark.parametrize("update", [
+    {"index": 0, "have": True},
+    {"index": 0, "add": False},
+    {"index": 0, "have": -1},
+    {"index": True, "add": 1},
+    {"index": 5, "add": 1},
+    {"index": 0, "have": "3"},
+    {"id": "3001", "add": 1},
+])
+def test_invalid_updates_are_rejected(server, update):
+    status, body = request(
+        server, "POST", f"/sets/{quote(SET_TITLE)}/parts",
+        {"updates": [{"index": 1, "add": 1}, update]}
+    )
+    assert status == 400
+    assert "error" in body
+
+    # Nothing in a rejected batch is applied
+    parts = set_file(server)["parts"]
+    assert [part["have"] for part in parts] == [0, 0]
+
+
+def test_updates_by_part_and_absolute_counts(server):
+    status, body = request(
+        server, "POST", f"/sets/{quote(SET_TITLE)}/parts",
+        {"updates": [
+            {"id": "3002", "color": "blue", "have": 4},
+            {"index": 0, "add": 2},
+        ]}
+    )
+    assert status == 200
+    assert {part["id"]: part["have"] for part in body["changed"]} == {
+        "3001": 2, "3002": 4
+    }
+    assert [part["have"] for part in set_file(server)["parts"]] == [2, 4]
+
+
+def test_unknown_set_and_path(server):
+    assert request(server, "GET", "/sets/Missing")[0] == 404
+    assert request(server, "GET", "/nowhere")[0] == 404
+    status, body = request(server, "GET", "/sets")
+    assert status == 200
+    assert body[0]["title"] == SET_TITLE
+
+
+def test_search_sees_queued_updates(server):
+    status, body = request(server, "GET", "/search?q=3002")
+    assert status == 200
+    assert body[0]["total_needed"] == 5
+
+    request(
+        server, "POST", f"/sets/{quote(SET_TITLE)}/parts",
+        {"updates": [{"index": 1, "add": 2}]}
+    )
+    status, body = request(server, "GET", "/search?q=3002")
+    assert body[0]["total_needed"] == 3